@@ -0,0 +1,171 @@
+'''
+# This file benchmarks the scraper stage by stage.
+# It runs the funds parse, the policy parse, the extraction and the writing
+# of the results separately on a download bundle, and reports the products
+# per second and peak memory of each one, so a slow down in parse_funds_file,
+# schema_2 / schema_3 or policy_row shows up as a number.
+#
+# Each stage runs in a fresh process, so its peak memory is not hidden by an
+# earlier stage. A stage still has to parse (and extract) the products it
+# works on, so its peak memory includes the stages before it, while its time
+# only covers the stage itself.
+#
+# With --products N a synthetic bundle of N products is generated first
+# (see synthetic.py), otherwise --bundle gives the bundle to read: a directory,
+# zip archive or compressed XML file, see bundle.py. Files are read through
+# the Bundle and xml_parser.read_products, as in a scrape.
+#
+# Usage: python benchmark.py --products 10000
+'''
+
+import os, json, time, argparse, tempfile, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from bundle import open_bundle
+from metrics import peak_rss_mb
+from parse_funds import parse_funds_file, FundRegistry
+from product_index import ProductIndex
+from sinks import SINKS, open_sink
+from synthetic import generate_bundle
+from xml_parser import scrape_policy, policy_row, read_products
+from constants import *
+
+STAGES = ["funds", "parse", "extract", "write"]
+
+
+class Timed():
+    '''
+    Iterator wrapper that adds the time spent getting each item to seconds.
+    '''
+    def __init__(self, items):
+        self.items = iter(items)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            return next(self.items)
+        finally:
+            self.seconds += time.perf_counter() - start
+
+def extract_rows(file, funds_dict, products):
+    '''
+    Extracts the rows of the given products, timing only the extraction.
+    Returns the rows and the seconds spent.
+    '''
+    rows = []
+    seconds = 0.0
+    for product in products:
+        start = time.perf_counter()
+        rows.append(policy_row(scrape_policy(ProductIndex(product), file, funds_dict)))
+        seconds += time.perf_counter() - start
+    return rows, seconds
+
+def run_stage(stage, bundle_path, stream, output_format):
+    '''
+    Runs a single stage over the whole bundle.
+    Returns the stage results: items handled, seconds and peak memory.
+    '''
+    with open_bundle(bundle_path) as bundle:
+        start = time.perf_counter()
+        funds_dict = FundRegistry(parse_funds_file(bundle.open_funds()))
+        if stage == "funds":
+            return {"items": len(funds_dict), "seconds": time.perf_counter() - start, \
+                    "peak_rss_mb": peak_rss_mb()}
+        items, seconds = run_file_stages(stage, bundle, funds_dict, stream, output_format)
+
+    return {"items": items, "seconds": seconds, "peak_rss_mb": peak_rss_mb()}
+
+def run_file_stages(stage, bundle, funds_dict, stream, output_format):
+    '''
+    Runs the parse, extract or write stage over the policy XML files of the bundle.
+    Returns the items handled and the seconds spent in the stage.
+    '''
+    items = 0
+    seconds = 0.0
+    with tempfile.TemporaryDirectory() as out_dir:
+        for file in bundle.policy_files():
+            # Souping a whole file happens up front, streaming happens per product.
+            start = time.perf_counter()
+            _, products = read_products(bundle, file, stream)
+            products = Timed(products)
+            products.seconds += time.perf_counter() - start
+            if stage == "parse":
+                items += sum(1 for _ in products)
+                seconds += products.seconds
+                continue
+            rows, extract_seconds = extract_rows(file, funds_dict, products)
+            items += len(rows)
+            if stage == "extract":
+                seconds += extract_seconds
+                continue
+            start = time.perf_counter()
+            sink = open_sink(output_format, os.path.join(out_dir, file[:-4]))
+            for row in rows:
+                sink.write_row(row)
+            sink.close()
+            seconds += time.perf_counter() - start
+
+    return items, seconds
+
+def run_benchmark(bundle, stream=False, output_format="xlsx", stages=STAGES):
+    '''
+    Runs every stage in its own fresh process.
+    Returns {stage: stage results}.
+    '''
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for stage in stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_stage, stage, bundle, stream, output_format).result()
+        seconds = result["seconds"]
+        result["items_per_sec"] = result["items"] / seconds if seconds else 0.0
+        results[stage] = result
+    return results
+
+def print_results(results):
+    print(f"{'stage':<10}{'items':>10}{'seconds':>12}{'items/sec':>14}{'peak RSS MB':>14}")
+    for stage, result in results.items():
+        print(f"{stage:<10}{result['items']:>10}{result['seconds']:>12.2f}"
+              f"{result['items_per_sec']:>14.1f}{result['peak_rss_mb']:>14.1f}")
+
+def parse_args():
+    '''
+    Parses the command line options.
+    '''
+    parser = argparse.ArgumentParser(description="Benchmarks the scraper stage by stage.")
+    parser.add_argument("--bundle", metavar="PATH", \
+        help="directory, zip archive or single (compressed) XML file to benchmark")
+    parser.add_argument("--products", type=int, default=1000, metavar="N", \
+        help="without --bundle, number of products of the synthetic bundle (default: 1000)")
+    parser.add_argument("--stream", action="store_true", \
+        help="read products one at a time instead of souping whole files")
+    parser.add_argument("--format", choices=sorted(SINKS), default="xlsx", \
+        help="output format of the write stage (default: xlsx)")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES, \
+        help="stages to run (default: all)")
+    parser.add_argument("--json", metavar="FILE", \
+        help="also write the results to a JSON file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bundle = args.bundle
+        if bundle is None:
+            bundle = os.path.join(tmp_dir, "bundle")
+            print(f"... Generating a synthetic bundle of {args.products} products ...")
+            generate_bundle(bundle, args.products)
+        results = run_benchmark(bundle, args.stream, args.format, args.stages)
+
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump(results, out, indent=2)
+
+
+if __name__ == "__main__":
+    main()
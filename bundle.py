@@ -0,0 +1,132 @@
+'''
+# This file contains the class declaration for a download bundle.
+# A Bundle gives access to the funds file and the policy XML files of a
+# release, wherever they are:
+#  - a directory, such as the unpacked ./privatehealth-04-apr-2019 (default),
+#  - the zip archive downloaded from data.gov.au, read without unpacking it,
+#  - a single policy XML file, with the funds file next to it.
+# Any of the XML files can also be compressed with gzip, xz or bzip2
+# (e.g. "Funds 04-Apr-2019.xml.gz"), they are decompressed while read.
+#
+# Members are opened as binary file objects, which lxml and BeautifulSoup
+# read directly, so nothing is ever extracted to disk. A Bundle is closed,
+# e.g. with a with statement, to close the zip archive it reads.
+'''
+
+import sys, os, gzip, lzma, bz2, zipfile
+
+from constants import *
+
+# File suffix: function opening a compressed file object for reading.
+DECOMPRESSORS = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+    ".bz2": bz2.open,
+}
+
+
+def xml_name(member):
+    '''
+    Gets the name of an XML file of the bundle, without its directory
+    and without the suffix of its compression, if any.
+    '''
+    name = os.path.basename(member)
+    for suffix in DECOMPRESSORS:
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+def get_pol_type(file_name):
+    '''
+    Gets the type for the policy.
+    '''
+    if 'Hospital' in file_name:
+        return 'Hospital'
+    elif 'General' in file_name:
+        return 'General'
+    elif 'Combined' in file_name:
+        return 'Combined'
+    else:
+        return "Can't find policy type."
+
+def is_policy_file(name):
+    return ".xml" in name and "Funds" not in name
+
+
+class Bundle():
+    def __init__(self, path):
+        self.path = path
+        self.zip = None
+        only = None
+        if os.path.isdir(path):
+            self.directory = path
+            members = sorted(os.listdir(path))
+        elif zipfile.is_zipfile(path):
+            self.zip = zipfile.ZipFile(path)
+            members = [m for m in self.zip.namelist() if not m.endswith('/')]
+        elif os.path.isfile(path):
+            # A single policy file, the funds file is looked up next to it.
+            self.directory = os.path.dirname(path) or "."
+            members = sorted(os.listdir(self.directory))
+            only = xml_name(path)
+        else:
+            raise FileNotFoundError(f"Cannot find the bundle {path}.")
+        # name: member of the directory or zip archive
+        self.members = {}
+        for member in members:
+            name = xml_name(member)
+            if only is not None and is_policy_file(name) and name != only:
+                continue
+            self.members.setdefault(name, member)
+
+    def policy_files(self):
+        '''
+        Gets the names of all the policy XML files of the bundle, sorted
+        so that a directory and a zip archive list them in the same order.
+        '''
+        return sorted(name for name in self.members if is_policy_file(name))
+
+    def open(self, name):
+        '''
+        Opens an XML file of the bundle for reading, as a binary file.
+        '''
+        if name not in self.members:
+            raise FileNotFoundError(f"Cannot find {name} in {self.path}.")
+        member = self.members[name]
+        if self.zip is not None:
+            xml_file = self.zip.open(member)
+        else:
+            xml_file = open(os.path.join(self.directory, member), "rb")
+        for suffix, decompress in DECOMPRESSORS.items():
+            if member.endswith(suffix):
+                return decompress(xml_file, "rb")
+        return xml_file
+
+    def open_funds(self):
+        '''
+        Opens the funds XML file of the bundle.
+        '''
+        return self.open(FUND_FILE_NAME)
+
+    def close(self):
+        '''
+        Closes the zip archive of the bundle, if any. Members still open
+        can be read until they are closed.
+        '''
+        if self.zip is not None:
+            self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_bundle(path=None):
+    '''
+    Opens the bundle at path, by default the XML_FILES_DIR directory.
+    '''
+    if path is None:
+        path = f"{sys.path[0]}/{XML_FILES_DIR}"
+    return Bundle(path)
@@ -0,0 +1,138 @@
+'''
+# This file contains the class declaration for the checkpoints of a scrape.
+# With --checkpoint (or --resume), while a policy XML file is scraped, the rows
+# extracted from its products are saved with their positions every
+# CHECKPOINT_INTERVAL products, and whenever the scrape stops on an error. If
+# the run dies partway through a large file, --resume starts again after the
+# last saved product instead of at the start of the file, and the output is
+# the same as an uninterrupted run. Other runs hash nothing and save nothing.
+#
+# Checkpoints are kept in the cache directory, keyed by the file name and a
+# context hashing the file, the funds file, ROW_VERSION, the columns and the
+# product filters, so they are never used for another input or extraction. Once the output file is
+# written they are replaced by a record of it, so --resume skips the files
+# that were finished.
+'''
+
+import sys, os, json, sqlite3, hashlib
+
+from parse_funds import fund_cache_file
+from constants import *
+
+# Number of products scraped between two checkpoints.
+CHECKPOINT_INTERVAL = 500
+
+
+class Checkpoint():
+    def __init__(self, checkpoint_file, file, context):
+        self.file = file
+        self.context = context
+        self.conn = sqlite3.connect(checkpoint_file, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS saved_rows (file TEXT NOT NULL, context TEXT NOT NULL, "
+            "position INTEGER NOT NULL, link TEXT NOT NULL, row TEXT NOT NULL, "
+            "PRIMARY KEY (file, context, position))"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS finished (file TEXT NOT NULL, context TEXT NOT NULL, "
+            "destination TEXT NOT NULL, PRIMARY KEY (file, context))"
+        )
+        self.pending = []
+
+    def rows(self, start=0, stop=None):
+        '''
+        Gets the (position, link, row) of the products saved from position
+        start, up to the first product that was not saved or up to stop.
+        '''
+        found = self.conn.execute(
+            "SELECT position, link, row FROM saved_rows WHERE file = ? AND context = ? AND position >= ? "
+            "ORDER BY position", (self.file, self.context, start)
+        )
+        rows = []
+        for position, link, row in found:
+            if position != start + len(rows) or (stop is not None and position >= stop):
+                break
+            rows.append((position, link, json.loads(row)))
+        return rows
+
+    def add(self, position, link, row):
+        '''
+        Saves the link and row extracted from the product at a position.
+        The link is kept apart as the row may not have its column. A
+        product that was filtered out is saved with a row of None.
+        '''
+        self.pending.append((self.file, self.context, position, link, json.dumps(row)))
+        if len(self.pending) >= CHECKPOINT_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany("INSERT OR REPLACE INTO saved_rows VALUES (?, ?, ?, ?, ?)", self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def finished(self):
+        '''
+        Gets the output file written for the file, if it was finished
+        and the output file is still there. Returns None otherwise.
+        '''
+        found = self.conn.execute(
+            "SELECT destination FROM finished WHERE file = ? AND context = ?", (self.file, self.context)
+        ).fetchone()
+        if found is None or not os.path.exists(found[0]):
+            return None
+        return found[0]
+
+    def finish(self, destination):
+        '''
+        Replaces the checkpoints of the file by the output file written from them.
+        '''
+        self.clear()
+        self.conn.execute("INSERT INTO finished VALUES (?, ?, ?)", (self.file, self.context, destination))
+        self.conn.commit()
+
+    def discard_others(self):
+        '''
+        Removes the checkpoints of the file saved for another input.
+        '''
+        for table in ("saved_rows", "finished"):
+            self.conn.execute(f"DELETE FROM {table} WHERE file = ? AND context != ?", \
+                              (self.file, self.context))
+        self.conn.commit()
+
+    def clear(self):
+        '''
+        Removes every checkpoint of the file.
+        '''
+        self.pending = []
+        for table in ("saved_rows", "finished"):
+            self.conn.execute(f"DELETE FROM {table} WHERE file = ?", (self.file,))
+        self.conn.commit()
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def checkpoint_context(bundle, file, columns, filters=None):
+    '''
+    Gets the context of the checkpoints of a policy XML file of the bundle:
+    a hash of the file, of the funds file, of ROW_VERSION, of the output
+    columns and of the product filters (see ProductFilter.spec), if any.
+    '''
+    sha = hashlib.sha1(os.path.basename(fund_cache_file(bundle)).encode())
+    sha.update(f"row-v{ROW_VERSION}".encode())
+    sha.update(json.dumps(columns).encode())
+    if filters:
+        sha.update(json.dumps(filters, sort_keys=True).encode())
+    with bundle.open(file) as xml_file:
+        for block in iter(lambda: xml_file.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def open_checkpoint(file, context):
+    '''
+    Opens the checkpoints of a policy XML file in the cache directory.
+    '''
+    os.makedirs(f"{sys.path[0]}/{CACHE_DIR}", exist_ok=True)
+    return Checkpoint(f"{sys.path[0]}/{CACHE_DIR}/{CHECKPOINT_FILE}", file, context)
@@ -12,14 +12,100 @@ TITLE = "============== DBN XML SCRAPER =============="
 # Following constants are required file names and links.
 # ==================================================================
 
+XML_FILES_DIR  = "privatehealth-04-apr-2019"
 FUND_FILE_NAME = "Funds 04-Apr-2019.xml"
 MAIN_URL       = "www.privatehealth.gov.au"
 DOWNLOAD_LINK  = MAIN_URL + "/dynamic/Download/"
+CACHE_DIR      = "cache"
+PRODUCT_STORE_FILE = "products.sqlite"
+CHECKPOINT_FILE = "checkpoints.sqlite"
+
+# ==================================================================
+# Following constants are required for reusing extracted rows.
+# ==================================================================
+
+# Version of the rows extracted from a product. Bump it whenever policy_row,
+# the schema extractors or the row layout change, so that rows stored by an
+# earlier version are extracted again.
+ROW_VERSION = 1
+
+# ==================================================================
+# Following constants are required for parallel scraping.
+# ==================================================================
+
+# Files with more products than this are split into shards of this size.
+SHARD_SIZE = 5000
+
+# ==================================================================
+# Following constants are required for memoizing extracted covers.
+# ==================================================================
+
+# Number of distinct hospital covers / general services kept per process.
+MEMO_SIZE = 1024
+
+# ==================================================================
+# Following constants are required for the pipelined scrape.
+# ==================================================================
+
+# Products sent to an extraction worker at a time.
+PIPELINE_BATCH_SIZE = 100
+# Batches per extraction worker that can be waiting to be written.
+PIPELINE_DEPTH = 4
+
+# ==================================================================
+# Following constants are required for the funds.
+# ==================================================================
+
+# Value of the fields read from the funds file, for a fund it does not have.
+MISSING_FUND = "Fund not found."
 
 # ==================================================================
 # Following constants are required for columns in the excel sheet.
 # ==================================================================
 
+COL_NAMES = [
+    "PDF Type", "Name", "Fund", "PDFLink", "Status", "Excess",
+    "Monthly Premium", "State", "Adults", "Scale (Adults + Dependants)",
+    "Availability", "Policy Type", "Corporate Product",
+    "Hospital Cover During Visit", "Hospital Services not Covered",
+    "Hospital Services Limited Cover", "Waiting periods", "Copayment",
+    "Other Hospital Cover Features", "General Dental - WP",
+    "General Dental - Limits", "General Dental - Max Benefits",
+    "Major Dental - WP", "Major Dental - Limits", "Major Dental - Max Benefits",
+    "Endodontic - WP", "Endodontic - Limits", "Endodontic - Max Benefits",
+    "Orthodontic - WP", "Orthodontic - Limits", "Orthodontic - Max Benefits",
+    "Optical - WP", "Optical - Limits", "Optical - Max Benefits",
+    "NonPBSPharmaceuticals - WP", "NonPBSPharmaceuticals - Limits",
+    "NonPBSPharmaceuticals - Max Benefits", "Physio - WP", "Physio - Limits",
+    "Physio - Max Benefits", "Chiropractic - WP", "Chiropractic - Limits",
+    "Chiropractic - Max Benefits", "Podiatry - WP", "Podiatry - Limits",
+    "Podiatry - Max Benefits", "Psychology - WP", "Psychology - Limits",
+    "Psychology - Max Benefits", "Acupuncture - WP", "Acupuncture - Limits",
+    "Acupuncture - Max Benefits", "Naturopathy - WP", "Naturopathy - Limits",
+    "Naturopathy - Max Benefits", "Massage - WP", "Massage - Limits",
+    "Massage - Max Benefits", "HearingAids - WP", "HearingAids - Limits",
+    "HearingAids - Max Benefits", "BloodGlucose Monitoring - WP",
+    "BloodGlucose Monitoring - Limits", "BloodGlucose Monitoring - Max Benefits",
+    "Ambulance - Emergency", "Ambulance - Call out fees", "Ambulance - other information",
+    "Other Treatment Cover Features", "Medicare Surcharge Levy", "Issue Date",
+    "Available for", "Provider Arrangements", "Youth discount",
+    "Travel and accommodation beneft", "Policy ID", "Accident cover"
+]
+
+# Columns kept as numbers in a PolicyTable (see policy_table.py).
+NUMBER_COL_NAMES = ["Monthly Premium", "Adults"]
+
+# Columns of the summary export (--summary), filled by policy_summary_row.
+SUMMARY_COL_NAMES = [
+    "Name", "Fund", "PDFLink", "Status", "Monthly Premium", "State", "Adults",
+    "Scale (Adults + Dependants)", "Policy Type"
+]
+
+# Columns of the release diff (release_diff.py), one row per changed field.
+DIFF_COL_NAMES = [
+    "Change", "Policy ID", "Policy Type", "Name", "Fund", "Field", "Old", "New", "Delta"
+]
+
 COL_PDF_TYPE          = 1
 COL_POL_NAME          = 2
 COL_FUND_NAME         = 3
@@ -68,4 +154,15 @@ COL_PROV_ARR          = 72
 COL_AGE_DISC          = 73
 COL_TRAV_ACCOM_BEN    = 74
 COL_POL_ID            = 75
-COL_ACCIDENT_COV      = 76
\ No newline at end of file
+COL_ACCIDENT_COV      = 76
+
+# Columns of the general services, matched in this order against the
+# title of each service. Ambulance only has columns for schema 2.0 policies.
+GENERAL_SERVICE_COLS = [
+    ("DentalGeneral", COL_GENERAL_DENTAL), ("DentalMajor", COL_MAJOR_DENTAL),
+    ("Endodontic", COL_ENDODONTIC), ("Orthodontic", COL_ORTHODONTIC),
+    ("Optical", COL_OPTICAL), ("NonPBS", COL_NONPSBPHARM), ("Physio", COL_PHYSIO),
+    ("Chiro", COL_CHIRO), ("Podiatry", COL_PODIATRY), ("Psychology", COL_PSYCH),
+    ("Acupuncture", COL_ACUPUNC), ("Naturopathy", COL_NATUR), ("Massage", COL_MASSAGE),
+    ("HearingAids", COL_HEARING), ("Glucose", COL_BLOOD),
+]
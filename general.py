@@ -8,6 +8,8 @@
 '''
 
 class GeneralService():
+    __slots__ = ("name", "cover", "wait", "limits", "max_ben")
+
     def __init__(self, name, cover, wait, limits, max_ben):
         self.name = name 
         self.cover = cover
@@ -10,6 +10,8 @@
 '''
 
 class HospService():
+    __slots__ = ("covered", "not_covered", "limited_cover", "wait", "other", "co_pay")
+
     def __init__(self, covered, not_covered, limited_cover, wait, other, co_pay):
         self.covered = covered 
         self.not_covered = not_covered 
@@ -0,0 +1,93 @@
+'''
+# This file contains the class declaration for the product store used by
+# incremental scrapes. Consecutive releases only change a small part of
+# the products, so for every product the store keeps a hash of its XML and
+# the row that was extracted from it, keyed by pol_id (fundcode/productcode)
+# and the policy type of its file, so Hospital, General and Combined files
+# never overwrite each other.
+# When a product comes back with the same hash its stored row is reused
+# and the product does not have to be extracted again. The hash also covers
+# the funds file, ROW_VERSION and COL_NAMES, so a row is never reused with
+# other funds information, another version of the extraction or other columns.
+'''
+
+import sys, os, json, sqlite3, hashlib
+
+from parse_funds import fund_cache_file
+from constants import *
+
+# Number of new rows kept in memory before they are written to the store.
+STORE_BATCH_SIZE = 500
+
+
+class ProductStore():
+    def __init__(self, store_file, context):
+        '''
+        context is mixed into every hash, so rows extracted with other
+        funds information, extraction code or columns are never reused.
+        '''
+        self.context = context.encode()
+        self.conn = sqlite3.connect(store_file, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products (pol_type TEXT NOT NULL, pol_id TEXT NOT NULL, "
+            "digest TEXT NOT NULL, row TEXT NOT NULL, PRIMARY KEY (pol_type, pol_id))"
+        )
+        self.pending = []
+        self.reused = 0
+        self.extracted = 0
+
+    def digest(self, *parts):
+        '''
+        Gets the hash of the given strings, such as the XML of a product.
+        '''
+        sha = hashlib.sha1(self.context)
+        for part in parts:
+            sha.update(part.encode())
+        return sha.hexdigest()
+
+    def get(self, pol_type, pol_id, digest):
+        '''
+        Gets the stored row of a product if its hash has not changed.
+        Returns None otherwise.
+        '''
+        found = self.conn.execute(
+            "SELECT row FROM products WHERE pol_type = ? AND pol_id = ? AND digest = ?", \
+            (pol_type, pol_id, digest)
+        ).fetchone()
+        if found is None:
+            self.extracted += 1
+            return None
+        self.reused += 1
+        return json.loads(found[0])
+
+    def put(self, pol_type, pol_id, digest, row):
+        '''
+        Stores the row extracted from a product.
+        '''
+        self.pending.append((pol_type, pol_id, digest, json.dumps(row)))
+        if len(self.pending) >= STORE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany("INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?)", self.pending)
+        self.conn.commit()
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+
+def open_product_store(bundle):
+    '''
+    Opens the product store in the cache directory. The store is tied to
+    the funds file of the bundle, as the rows depend on the funds information,
+    and to ROW_VERSION and COL_NAMES, as they depend on the extraction code.
+    '''
+    os.makedirs(f"{sys.path[0]}/{CACHE_DIR}", exist_ok=True)
+    sha = hashlib.sha1(os.path.basename(fund_cache_file(bundle)).encode())
+    sha.update(f"row-v{ROW_VERSION}".encode())
+    sha.update(json.dumps(COL_NAMES).encode())
+    context = sha.hexdigest()
+    return ProductStore(f"{sys.path[0]}/{CACHE_DIR}/{PRODUCT_STORE_FILE}", context)
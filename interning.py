@@ -0,0 +1,70 @@
+'''
+# This file contains the string pool used while extracting policies.
+# Most of the text of a policy is repeated across products: the restrictions
+# of a fund are the same for each of its products, and so are the provider
+# arrangements, excesses, waiting periods, benefits and service titles.
+# The Interner keeps one copy of each distinct string (or tuple of them, such
+# as the (state, text) provider pairs of a fund) and hands that copy out
+# every time an equal value is extracted, so the duplicates can be freed.
+# It only covers the values of policies and funds while they are extracted:
+# the output rows are not interned, the DictColumn columns of a PolicyTable
+# (see policy_table.py) already keep one copy of each distinct cell.
+#
+# Every duplicate dropped is counted in the run metrics: "interned" is the
+# number of values and "interned_bytes" the memory they took.
+'''
+
+import sys
+
+from metrics import METRICS
+
+
+class Interner():
+    def __init__(self):
+        # value: its canonical copy
+        self.pool = {}
+
+    def __len__(self):
+        return len(self.pool)
+
+    def intern(self, value):
+        '''
+        Gets the canonical copy of a string or tuple of strings.
+        '''
+        canonical = self.pool.setdefault(value, value)
+        if canonical is not value:
+            METRICS.count("interned")
+            METRICS.count("interned_bytes", sys.getsizeof(value))
+        return canonical
+
+    def intern_value(self, value):
+        '''
+        Interns a value extracted from a policy: strings and tuples are
+        replaced by their canonical copy, lists, dicts and service objects
+        (HospService, GeneralService) have their contents interned in place.
+        Any other value is returned as it is.
+        '''
+        if isinstance(value, str):
+            return self.intern(value)
+        if isinstance(value, tuple):
+            return self.intern(tuple([self.intern_value(v) for v in value]))
+        if isinstance(value, list):
+            value[:] = [self.intern_value(v) for v in value]
+        elif isinstance(value, dict):
+            for key in value:
+                value[key] = self.intern_value(value[key])
+        else:
+            for slot in getattr(type(value), "__slots__", ()):
+                if hasattr(value, slot):
+                    setattr(value, slot, self.intern_value(getattr(value, slot)))
+        return value
+
+    def clear(self):
+        '''
+        Empties the pool, once nothing kept needs to share its strings.
+        '''
+        self.pool = {}
+
+
+# Strings of the current run, in this process.
+INTERNER = Interner()
@@ -0,0 +1,60 @@
+'''
+# This file contains the memo of extracted covers.
+# The same hospital and extras cover is published as many products that
+# only differ in state, scale or excess, so get_hosp_details and
+# get_general_services would build the same HospService and general services
+# dict again for each of them. A SubtreeMemo keys the built value on a hash
+# of the XML it was built from, and hands it out again for every product
+# with the same XML. It keeps the MEMO_SIZE most recently used values.
+#
+# Hits and misses are counted in the run metrics, as memo_<name>_hits and
+# memo_<name>_misses.
+'''
+
+import hashlib
+from collections import OrderedDict
+
+from metrics import METRICS
+from constants import *
+
+
+class SubtreeMemo():
+    def __init__(self, name, size=MEMO_SIZE):
+        self.name = name
+        self.size = size
+        # hash of the subtrees: value built from them, least recently used first
+        self.values = OrderedDict()
+
+    def __len__(self):
+        return len(self.values)
+
+    def get(self, parts, build):
+        '''
+        Gets the value built from the subtrees described by parts
+        (str or bytes), calling build() only if it is not memoized yet.
+        The value is shared by every product with the same subtrees, so
+        it must not be changed afterwards.
+        '''
+        digest = hashlib.blake2b(digest_size=16)
+        for part in parts:
+            digest.update(part.encode() if isinstance(part, str) else part)
+            digest.update(b"\0")
+        key = digest.digest()
+        if key in self.values:
+            METRICS.count(f"memo_{self.name}_hits")
+            self.values.move_to_end(key)
+            return self.values[key]
+        METRICS.count(f"memo_{self.name}_misses")
+        value = build()
+        self.values[key] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+        return value
+
+    def clear(self):
+        self.values.clear()
+
+
+# Memos of the current run, in this process.
+HOSP_MEMO = SubtreeMemo("hosp_cover")
+GENERAL_MEMO = SubtreeMemo("gen_services")
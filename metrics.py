@@ -0,0 +1,179 @@
+'''
+# This file contains the run metrics and the progress reporter.
+# Metrics keeps the total time and number of calls of every stage of a run
+# (funds parsing, parsing the policy files, each extractor, writing), so we
+# can see which stage slows down as the data grows. The totals are written
+# to a JSON file at the end of each run, together with the products per
+# second and the peak memory.
+#
+# Progress replaces printing a line for every product, which costs more than
+# it should on large files: it prints at most once every PROGRESS_INTERVAL.
+'''
+
+import sys, time, json, resource
+from contextlib import contextmanager
+from functools import wraps
+
+# Seconds between two progress lines.
+PROGRESS_INTERVAL = 0.5
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    '''
+    Gets the peak resident memory in MB, of this process by default.
+    '''
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    if sys.platform == "darwin":
+        return peak / (1 << 20)
+    return peak / (1 << 10)
+
+
+class Metrics():
+    def __init__(self):
+        self.start = time.perf_counter()
+        # stage: [total seconds, calls]
+        self.stages = {}
+        self.counts = {}
+
+    def add(self, stage, seconds, calls=1):
+        '''
+        Adds time spent in a stage.
+        '''
+        if stage in self.stages:
+            self.stages[stage][0] += seconds
+            self.stages[stage][1] += calls
+        else:
+            self.stages[stage] = [seconds, calls]
+
+    def count(self, name, n=1):
+        '''
+        Adds n to a counter, such as the number of products scraped.
+        '''
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, stage):
+        '''
+        Times the body of a with statement as a call of stage.
+        '''
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def timed(self, stage):
+        '''
+        Decorator timing every call of a function as a call of stage.
+        '''
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, stage, items):
+        '''
+        Yields the items, timing the work of getting each one as stage.
+        Used for readers that parse lazily, such as stream.iter_products.
+        '''
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - start, 0)
+                return
+            self.add(stage, time.perf_counter() - start)
+            yield item
+
+    def take(self):
+        '''
+        Gets the stage totals and counters, and resets them.
+        Worker processes send these back to be merged into the main metrics.
+        '''
+        taken = (self.stages, self.counts)
+        self.stages = {}
+        self.counts = {}
+        return taken
+
+    def merge(self, taken):
+        '''
+        Adds the totals got from take() in another process.
+        '''
+        stages, counts = taken
+        for stage in stages:
+            self.add(stage, *stages[stage])
+        for name in counts:
+            self.count(name, counts[name])
+
+    def summary(self):
+        '''
+        Gets the metrics of the run as a dict, ready to be written as JSON.
+        '''
+        elapsed = time.perf_counter() - self.start
+        products = self.counts.get("products", 0)
+        return {
+            "elapsed_seconds": elapsed,
+            "products": products,
+            "products_per_sec": products / elapsed if elapsed else 0.0,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_mb_workers": peak_rss_mb(resource.RUSAGE_CHILDREN),
+            "stages": {
+                stage: {"seconds": seconds, "calls": calls}
+                for stage, (seconds, calls) in sorted(self.stages.items())
+            },
+            "counts": dict(self.counts),
+            "hit_rates": self.hit_rates(),
+        }
+
+    def hit_rates(self):
+        '''
+        Gets the hit rate of every cache counted as <name>_hits and <name>_misses.
+        '''
+        rates = {}
+        for name in self.counts:
+            for suffix in ("_hits", "_misses"):
+                if name.endswith(suffix):
+                    cache = name[:-len(suffix)]
+                    hits = self.counts.get(cache + "_hits", 0)
+                    rates[cache] = hits / (hits + self.counts.get(cache + "_misses", 0))
+        return rates
+
+    def write_json(self, file_name):
+        with open(file_name, "w") as out:
+            json.dump(self.summary(), out, indent=2)
+
+
+class Progress():
+    '''
+    Prints progress lines, at most once every PROGRESS_INTERVAL seconds and
+    always for the last item. message is formatted with done and total,
+    e.g. "Scraping product {done} of {total}."
+    '''
+    def __init__(self, message, total, done=0):
+        self.message = message
+        self.total = total
+        self.done = done
+        self.last = 0.0
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if now - self.last >= PROGRESS_INTERVAL or str(self.done) == str(self.total):
+            self.last = now
+            print(self.message.format(done=self.done, total=self.total), end='\r')
+
+    def close(self):
+        print('\n')
+
+
+# Metrics of the current run, in this process.
+METRICS = Metrics()
@@ -5,16 +5,34 @@
 #
 # This file scrapes information on all the funds from 
 # the funds xml file. This file is assumed to exist in 
-# the ./privatehealth-04-apr-2019 directory, and is assumed
-# to be named FUND_FILE_NAME. If this changes, it can be 
-# modified in the constants.py folder.
+# the ./privatehealth-04-apr-2019 directory (or the bundle given,
+# see bundle.py), and is assumed to be named FUND_FILE_NAME.
+# If this changes, it can be modified in the constants.py folder.
+#
+# The parsed funds are cached on disk by load_funds, keyed by the content
+# hash of the funds file and FUND_PARSER_VERSION, so the funds file is only
+# parsed again when it changes.
+#
+# load_funds gives a FundRegistry, which indexes the provider arrangements
+# and the ambulance details of the funds by (fund code, state), so products
+# look them up without scanning the lists of a fund. Products of a fund that
+# is not in the funds file get MISSING_FUND instead of stopping the scrape.
 '''
 
-import sys
+import sys, os, hashlib, pickle
 from bs4 import BeautifulSoup
+from bundle import open_bundle
+from interning import INTERNER
+from metrics import METRICS
 from constants import *
 
+# Bump this whenever Fund, FundRegistry or get_fund_info changes, so old caches are ignored.
+FUND_PARSER_VERSION = 3
+
 class Fund():
+    __slots__ = ("code", "name", "preferred_provider_services", "amb_emer",
+                 "amb_call_out_fees", "amb_other", "restrictions")
+
     def __init__(self, code, name, preferred_provider_services, amb_emer, amb_call_out_fees, amb_other, restrictions):
         self.code = code
         self.name = name 
@@ -75,22 +93,123 @@ def get_fund_info(fund):
     if restrictions == "Not found":
         restrictions = "No restrictions"
 
+    # Funds share a lot of their text, such as the ambulance details of a state.
+    providers = INTERNER.intern_value(providers)
+    amb_other = INTERNER.intern_value(amb_other)
+    restrictions = INTERNER.intern(restrictions)
     fund_info = Fund(code, name, providers, amb_emer_str, amb_call_out_fees, amb_other, restrictions)
 
     return fund_info
 
 
-def parse_funds_file():
+
+class FundRegistry():
+    '''
+    The funds of a funds file, with their provider arrangements and
+    ambulance details indexed by (fund code, state). Lookups are counted
+    in the run metrics: fund_registry_hits and fund_registry_misses for
+    the fund codes, fund_state_hits and fund_state_misses for the states
+    of the funds found.
+    '''
+    def __init__(self, fund_dict):
+        # code: Fund object
+        self.funds = fund_dict
+        # (code, state): provider arrangements of the fund in that state
+        self.providers = {}
+        # (code, state): (amb_emer, amb_call_out_fees, amb_other) of the fund in that state
+        self.ambulance = {}
+        for code, fund in fund_dict.items():
+            for state, text in fund.preferred_provider_services:
+                # The first arrangement of a state is the one used.
+                self.providers.setdefault((code, state), text)
+            for state, text in fund.amb_other:
+                # The first details of a state are the ones used.
+                self.ambulance.setdefault((code, state), (fund.amb_emer, fund.amb_call_out_fees, text))
+        # Codes of the missing funds that were already reported.
+        self.missing = set()
+
+    def __len__(self):
+        return len(self.funds)
+
+    def __contains__(self, code):
+        return code in self.funds
+
+    def get(self, code):
+        '''
+        Gets the Fund object of a fund code, or None if the fund is not
+        in the funds file.
+        '''
+        self.count(code)
+        return self.funds.get(code)
+
+    def count(self, code, state_found=None):
+        '''
+        Counts a lookup for a fund code and, if state_found is given, whether
+        the fund has details for the state looked up. The first lookup of a
+        fund that is not in the funds file reports it.
+        '''
+        if code not in self.funds:
+            METRICS.count("fund_registry_misses")
+            if code not in self.missing:
+                self.missing.add(code)
+                # On its own line, as it can come in the middle of a progress line.
+                print(f"\nFund {code} is not in the funds file, its fields are \"{MISSING_FUND}\"")
+            return
+        METRICS.count("fund_registry_hits")
+        if state_found is not None:
+            METRICS.count("fund_state_hits" if state_found else "fund_state_misses")
+
+    def restrictions(self, code):
+        '''
+        Gets the restrictions of a fund, or MISSING_FUND.
+        '''
+        fund = self.get(code)
+        if fund is None:
+            return MISSING_FUND
+        return fund.restrictions
+
+    def provider(self, code, state):
+        '''
+        Gets the provider arrangements of a fund in a state, or None
+        if the fund has none there.
+        '''
+        provider = self.providers.get((code, state))
+        self.count(code, provider is not None)
+        return provider
+
+    def ambulance_details(self, code, state):
+        '''
+        Gets the (amb_emer, amb_call_out_fees, amb_other) of a fund in a state.
+        amb_other is "Not found." if the fund has no details for the state.
+        '''
+        details = self.ambulance.get((code, state))
+        self.count(code, details is not None)
+        if details is not None:
+            return details
+        fund = self.funds.get(code)
+        if fund is None:
+            return MISSING_FUND, MISSING_FUND, MISSING_FUND
+        return fund.amb_emer, fund.amb_call_out_fees, "Not found."
+
+
+def parse_funds_file(fund_file=None):
     '''
     This function goes through the fund file and collects information.
+    The fund file of the download bundle is used, unless another
+    fund_file is given, as a file name or an open file.
     Returns fund_dict, which contains the infromation.
     fund_dict = {
         code: Fund object 
     }
     '''
     # Find fund file and make soup.
-    fund_file = open(f"{sys.path[0]}/privatehealth-04-apr-2019/{FUND_FILE_NAME}")
-    fund_soup = BeautifulSoup(fund_file, "lxml")
+    if fund_file is None:
+        with open_bundle() as bundle:
+            return parse_funds_file(bundle.open_funds())
+    if isinstance(fund_file, str):
+        fund_file = open(fund_file, "rb")
+    with fund_file:
+        fund_soup = BeautifulSoup(fund_file, "lxml")
     # Set up fund dictionary to store all information.
     fund_dict = {}
     # Finds all funds.
@@ -101,5 +220,44 @@ def parse_funds_file():
     
     return fund_dict
 
+def fund_cache_file(bundle):
+    '''
+    Gets the cache file for the funds file of a bundle, named after the
+    hash of its contents and the parser version.
+    '''
+    sha = hashlib.sha256()
+    with bundle.open_funds() as fund_file:
+        for block in iter(lambda: fund_file.read(1 << 20), b""):
+            sha.update(block)
+    return f"{sys.path[0]}/{CACHE_DIR}/funds-v{FUND_PARSER_VERSION}-{sha.hexdigest()}.pickle"
+
+def load_funds(use_cache=True, bundle=None):
+    '''
+    Gets the FundRegistry of the funds of a bundle, by default the
+    download bundle, from the cache if the funds file has not changed
+    since it was last parsed. Otherwise the funds file is parsed and the
+    result is cached for the next run.
+    '''
+    if bundle is None:
+        with open_bundle() as bundle:
+            return load_funds(use_cache, bundle)
+    if not use_cache:
+        return FundRegistry(parse_funds_file(bundle.open_funds()))
+    cache_file = fund_cache_file(bundle)
+    try:
+        with open(cache_file, "rb") as cache:
+            return pickle.load(cache)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    registry = FundRegistry(parse_funds_file(bundle.open_funds()))
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    # Write to a temporary file first so a crash never leaves half a cache.
+    with open(cache_file + ".tmp", "wb") as cache:
+        pickle.dump(registry, cache, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(cache_file + ".tmp", cache_file)
+
+    return registry
+
 if __name__ == "__main__":
     parse_funds_file()
\ No newline at end of file
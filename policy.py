@@ -8,11 +8,25 @@
 # which is then used to populate the excel file.
 # OldPolicy is instantiated for schema 2.0 policies.
 # NewPolicy is instantiated for schema 3.0 policies.
+# LazyOldPolicy and LazyNewPolicy are the same policies, but their expensive
+# fields (hospital cover, general services, ...) are only extracted when they
+# are first read, so exports that never read them never pay for them.
+# The values of lazy policies are interned (see interning.py), so the text
+# repeated across products is only kept once.
 '''
 
 from abc import ABC
 
+from interning import INTERNER
+
 class Policy(ABC):
+    # __slots__ instead of a per-instance __dict__, as every product of a
+    # file is turned into a policy.
+    __slots__ = ("schema", "pol_name", "fund_name", "pdf_link", "status", "excess",
+                 "mo_prem", "state", "adults", "dpndnts", "avail", "pol_type", "corp",
+                 "medicare", "issue_date", "avail_for", "prov_arr", "hosp_cover",
+                 "gen_services", "other")
+
     def __init__(self, schema, pol_name, fund_name, pdf_link, status, \
                     excess, mo_prem, state, adults, dpndnts, avail, \
                     pol_type, corp, medicare, issue_date, avail_for, \
@@ -43,6 +57,8 @@ class OldPolicy(Policy):
     '''
     Policy class for schema 2 files. These are the old PDFs.
     '''
+    __slots__ = ()
+
     def __init__(self, schema, pol_name, fund_name, pdf_link, status, \
                     excess, mo_prem, state, adults, dpndnts, avail, \
                     pol_type, corp, medicare, issue_date, avail_for, \
@@ -84,6 +100,9 @@ class NewPolicy(Policy):
     '''
     Policy class for schema 3 files. These are the new PDFs.
     '''
+    __slots__ = ("youth_disc", "travel_accom_ben", "pol_id", "accident_cover",
+                 "amb_emer", "amb_callout_fees", "amb_other")
+
     def __init__(self, schema, pol_name, fund_name, pdf_link, status, \
                     excess, mo_prem, state, adults, dpndnts, avail, \
                     pol_type, corp, medicare, issue_date, avail_for, \
@@ -133,4 +152,106 @@ class NewPolicy(Policy):
         return string
 
 
+# Passed for a lazy field instead of its value, the field is then loaded on access.
+NOT_LOADED = object()
+
+class LazyField():
+    '''
+    A policy field that is only extracted the first time it is read.
+    The value is then kept in the slot the field has in Policy or
+    NewPolicy, so it is only extracted once.
+    '''
+    def __init__(self, group):
+        # Fields of the same group are extracted together by one loader.
+        self.group = group
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        for klass in owner.__mro__[1:]:
+            if name in vars(klass):
+                self.slot = vars(klass)[name]
+                break
+
+    def __get__(self, policy, owner=None):
+        if policy is None:
+            return self
+        try:
+            return self.slot.__get__(policy, owner)
+        except AttributeError:
+            policy.load(self.group)
+            return self.slot.__get__(policy, owner)
+
+    def __set__(self, policy, value):
+        if value is not NOT_LOADED:
+            self.slot.__set__(policy, value)
+
+
+class LazyPolicy():
+    '''
+    Mixin for policies with lazy fields. loaders maps each group of lazy
+    fields to a function returning {field name: value} for the group.
+    '''
+    __slots__ = ()
+
+    def load(self, group):
+        '''
+        Extracts the fields of a group, if it has not been loaded yet.
+        '''
+        loader = self.loaders.pop(group, None)
+        if loader is None:
+            return
+        for name, value in loader().items():
+            setattr(self, name, INTERNER.intern_value(value))
+
+    def load_all(self):
+        '''
+        Extracts every lazy field that has not been loaded yet.
+        '''
+        for group in list(self.loaders):
+            self.load(group)
+
+    def detach(self):
+        '''
+        Drops the loaders of the lazy fields not loaded yet, so the product
+        they extract from can be freed. Those fields are then None.
+        '''
+        for klass in type(self).__mro__:
+            for name, field in vars(klass).items():
+                if isinstance(field, LazyField) and field.group in self.loaders:
+                    field.slot.__set__(self, None)
+        self.loaders = {}
+
+
+class LazyOldPolicy(LazyPolicy, OldPolicy):
+    '''
+    OldPolicy whose hospital cover, general services and provider
+    arrangements are extracted on first access.
+    '''
+    __slots__ = ("loaders",)
+
+    hosp_cover = LazyField("hosp_cover")
+    gen_services = LazyField("gen_services")
+    prov_arr = LazyField("prov_arr")
+
+    def __init__(self, loaders, *args):
+        self.loaders = loaders
+        super().__init__(*[INTERNER.intern_value(arg) for arg in args])
+
+
+class LazyNewPolicy(LazyPolicy, NewPolicy):
+    '''
+    NewPolicy whose hospital cover, general services, provider
+    arrangements and ambulance details are extracted on first access.
+    '''
+    __slots__ = ("loaders",)
+
+    hosp_cover = LazyField("hosp_cover")
+    gen_services = LazyField("gen_services")
+    prov_arr = LazyField("prov_arr")
+    amb_emer = LazyField("ambulance")
+    amb_callout_fees = LazyField("ambulance")
+    amb_other = LazyField("ambulance")
 
+    def __init__(self, loaders, *args):
+        self.loaders = loaders
+        super().__init__(*[INTERNER.intern_value(arg) for arg in args])
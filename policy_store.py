@@ -0,0 +1,194 @@
+'''
+# This file contains the class declaration for a policy store.
+# A PolicyStore keeps the policies of a scrape in memory and answers
+# queries such as "all Hospital policies in NSW under $200/month from
+# fund X" without going through every policy: it keeps a hash index for
+# each of the fields in INDEXED_FIELDS and a sorted index on the monthly
+# premium.
+#
+# It can be used as a library (build_policy_store, PolicyStore.query) or
+# from the command line, e.g.
+#   python policy_store.py --fund ABC --state NSW --type Hospital --max-prem 200
+'''
+
+import sys, csv, bisect, datetime, argparse
+
+from bundle import open_bundle
+from metrics import Progress
+from parse_funds import load_funds
+from product_index import ProductIndex
+from sinks import SINKS, open_sink
+from xml_parser import read_products, scrape_policy, policy_summary_row
+from constants import *
+
+# Policy attributes with a hash index, and the keyword used for them in query.
+INDEXED_FIELDS = {
+    "fund": "fund_name",
+    "state": "state",
+    "status": "status",
+    "schema": "schema",
+    "pol_type": "pol_type",
+}
+
+
+def parse_premium(mo_prem):
+    '''
+    Gets the monthly premium of a policy as a number, or None.
+    '''
+    try:
+        return float(mo_prem)
+    except (TypeError, ValueError):
+        return None
+
+
+class PolicyStore():
+    def __init__(self, policies=()):
+        self.policies = []
+        # field: {value: set of positions in self.policies}
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        # Sorted (premium, position) pairs, rebuilt after new policies are added.
+        self.premiums = []
+        self.premiums_sorted = True
+        for policy in policies:
+            self.add(policy)
+
+    def __len__(self):
+        return len(self.policies)
+
+    def add(self, policy):
+        '''
+        Adds a policy and indexes it.
+        '''
+        position = len(self.policies)
+        self.policies.append(policy)
+        for field, attr in INDEXED_FIELDS.items():
+            self.indexes[field].setdefault(getattr(policy, attr), set()).add(position)
+        premium = parse_premium(policy.mo_prem)
+        if premium is not None:
+            self.premiums.append((premium, position))
+            self.premiums_sorted = False
+
+    def values(self, field):
+        '''
+        Gets the distinct values of an indexed field.
+        '''
+        return sorted(self.indexes[field])
+
+    def premium_range(self, min_prem=None, max_prem=None):
+        '''
+        Gets the positions of the policies with a monthly premium between
+        min_prem and max_prem, both included.
+        '''
+        if not self.premiums_sorted:
+            self.premiums.sort()
+            self.premiums_sorted = True
+        start = 0
+        stop = len(self.premiums)
+        if min_prem is not None:
+            start = bisect.bisect_left(self.premiums, (min_prem, -1))
+        if max_prem is not None:
+            stop = bisect.bisect_right(self.premiums, (max_prem, len(self.policies)))
+        return {position for _, position in self.premiums[start:stop]}
+
+    def query(self, min_prem=None, max_prem=None, **criteria):
+        '''
+        Gets the policies matching every criterion given, in the order they
+        were added. criteria are keywords of INDEXED_FIELDS, each with a
+        single value or a list of accepted values, e.g.
+            store.query(fund="ABC", state=["NSW", "ACT"], max_prem=200)
+        '''
+        candidates = []
+        for field, wanted in criteria.items():
+            if field not in INDEXED_FIELDS:
+                raise ValueError(f"Cannot query on {field}.")
+            if wanted is None:
+                continue
+            if isinstance(wanted, str):
+                wanted = [wanted]
+            index = self.indexes[field]
+            positions = set()
+            for value in wanted:
+                positions |= index.get(value, set())
+            candidates.append(positions)
+        if min_prem is not None or max_prem is not None:
+            candidates.append(self.premium_range(min_prem, max_prem))
+
+        if not candidates:
+            return list(self.policies)
+        # Intersect from the smallest set, so the work follows the matches.
+        candidates.sort(key=len)
+        matches = set(candidates[0])
+        for positions in candidates[1:]:
+            matches &= positions
+        return [self.policies[position] for position in sorted(matches)]
+
+
+def build_policy_store(bundle, funds_dict, stream=False, details=False):
+    '''
+    Scrapes the policy XML files of a bundle into a PolicyStore.
+    The policies are lazy, so only the fields that are read are extracted.
+    Unless details is set, the lazy fields are dropped once a policy is
+    indexed (they are then None), so the store does not keep the products
+    alive. With details, each policy keeps its product, and without stream
+    the soup of its whole file, until all its lazy fields have been read.
+    '''
+    store = PolicyStore()
+    for file in bundle.policy_files():
+        product_count, products = read_products(bundle, file, stream)
+        progress = Progress(f"Loading product {{done}} of {{total}} from {file}.", product_count)
+        for product in products:
+            progress.update()
+            policy = scrape_policy(ProductIndex(product), file, funds_dict, lazy=True)
+            if not details:
+                policy.detach()
+            store.add(policy)
+        progress.close()
+    return store
+
+def parse_args():
+    '''
+    Parses the command line options.
+    '''
+    parser = argparse.ArgumentParser(description="Queries the policies of the download bundle.")
+    parser.add_argument("--fund", nargs="+", help="fund codes to match")
+    parser.add_argument("--state", nargs="+", help="states to match")
+    parser.add_argument("--status", nargs="+", help="product statuses to match, e.g. Open")
+    parser.add_argument("--schema", nargs="+", help="schema versions to match, e.g. 3.0")
+    parser.add_argument("--type", dest="pol_type", nargs="+", \
+        help="policy types to match: Hospital, General or Combined")
+    parser.add_argument("--min-prem", type=float, help="lowest monthly premium")
+    parser.add_argument("--max-prem", type=float, help="highest monthly premium")
+    parser.add_argument("--input", metavar="PATH", \
+        help=f"directory, zip archive or single XML file to query (default: {XML_FILES_DIR})")
+    parser.add_argument("--stream", action="store_true", \
+        help="read products one at a time instead of souping whole files")
+    parser.add_argument("--format", choices=sorted(SINKS), \
+        help="write the matches to a file in the results directory instead of printing them")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    with open_bundle(args.input) as bundle:
+        funds_dict = load_funds(bundle=bundle)
+        store = build_policy_store(bundle, funds_dict, args.stream)
+    matches = store.query(fund=args.fund, state=args.state, status=args.status, \
+                          schema=args.schema, pol_type=args.pol_type, \
+                          min_prem=args.min_prem, max_prem=args.max_prem)
+    print(f"{len(matches)} of {len(store)} policies match.")
+
+    if args.format is None:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(SUMMARY_COL_NAMES)
+        for policy in matches:
+            writer.writerow(policy_summary_row(policy))
+        return
+    dest = f"{sys.path[0]}/results/query " + datetime.datetime.now().strftime("%d %B %Y at %H.%M")
+    sink = open_sink(args.format, dest, SUMMARY_COL_NAMES)
+    for policy in matches:
+        sink.write_row(policy_summary_row(policy))
+    sink.close()
+    print(f"-- Matches written to {sink.destination} --")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+'''
+# This file contains the class declaration for a policy table.
+# A PolicyTable holds the rows of a policy XML file while they wait to be
+# written, one column at a time instead of one list per row:
+#  - the columns of NUMBER_COL_NAMES (the monthly premium and the number of
+#    adults) are arrays of parsed numbers,
+#  - every other column is dictionary-encoded: an array of codes into the
+#    list of its distinct values, as most values repeat across products.
+# Rows are added in batches and are keyed by link: a row whose link is already
+# in the table replaces the earlier one in its place, as the rows dict did.
+# The sinks read the table column by column (see Sink.write_table), and
+# numbers / value_counts aggregate a column without building its cells.
+'''
+
+from array import array
+from collections import Counter
+
+from constants import *
+
+# Rows scraped before they are added to a table, see PolicyTable.add_rows.
+TABLE_BATCH_SIZE = 500
+# Cells of number columns with more decimals than this are kept as they are.
+MAX_DECIMALS = 20
+
+
+def format_number(value, decimals):
+    return f"{value:.{decimals}f}"
+
+def parse_number(text):
+    '''
+    Gets a cell of a number column as (value, decimals), with decimals
+    the number of digits after the point in the text. Returns None if
+    the text does not give back the same text once formatted, so that
+    it is kept as it is.
+    '''
+    if type(text) is not str:
+        return None
+    try:
+        value = float(text)
+    except ValueError:
+        return None
+    decimals = len(text) - text.index(".") - 1 if "." in text else 0
+    if decimals > MAX_DECIMALS or format_number(value, decimals) != text:
+        return None
+    return value, decimals
+
+
+class NumberColumn():
+    '''
+    A column of numbers, with the number of decimals of each cell so its
+    text can be given back. Cells that are not numbers are kept apart.
+    '''
+    def __init__(self):
+        self.values = array("d")
+        self.decimals = array("b")
+        # position: cell that is not a number
+        self.others = {}
+
+    def append(self, cells):
+        for cell in cells:
+            parsed = parse_number(cell)
+            if parsed is None:
+                self.others[len(self.values)] = cell
+                parsed = (float("nan"), -1)
+            self.values.append(parsed[0])
+            self.decimals.append(parsed[1])
+
+    def set(self, position, cell):
+        parsed = parse_number(cell)
+        self.others.pop(position, None)
+        if parsed is None:
+            self.others[position] = cell
+            parsed = (float("nan"), -1)
+        self.values[position], self.decimals[position] = parsed
+
+    def extend(self, other):
+        for position, cell in other.others.items():
+            self.others[len(self.values) + position] = cell
+        self.values.extend(other.values)
+        self.decimals.extend(other.decimals)
+
+    def cells(self):
+        # The cells that are not numbers have no decimals to format with.
+        others = self.others
+        return [others[i] if i in others else format_number(value, decimals) \
+                for i, (value, decimals) in enumerate(zip(self.values, self.decimals))]
+
+
+class DictColumn():
+    '''
+    A dictionary-encoded column: the code of each cell, and the
+    distinct cells of the column in the order they were first seen.
+    '''
+    def __init__(self):
+        self.codes = array("I")
+        self.values = []
+        # cell: its code
+        self.lookup = {}
+
+    def encode(self, cell):
+        code = self.lookup.get(cell)
+        if code is None:
+            code = self.lookup[cell] = len(self.values)
+            self.values.append(cell)
+        return code
+
+    def append(self, cells):
+        self.codes.extend(map(self.encode, cells))
+
+    def set(self, position, cell):
+        self.codes[position] = self.encode(cell)
+
+    def extend(self, other):
+        # Codes of the other column: codes in this one.
+        codes = [self.encode(cell) for cell in other.values]
+        self.codes.extend(map(codes.__getitem__, other.codes))
+
+    def cells(self):
+        return list(map(self.values.__getitem__, self.codes))
+
+
+class PolicyTable():
+    def __init__(self, columns=COL_NAMES):
+        self.columns = list(columns)
+        self.data = [NumberColumn() if name in NUMBER_COL_NAMES else DictColumn() \
+                     for name in self.columns]
+        # link: position of its row
+        self.index = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def links(self):
+        '''
+        Gets the links of the rows, in the order of the rows.
+        '''
+        return list(self.index)
+
+    def add_rows(self, rows):
+        '''
+        Adds a batch of (link, row) pairs. Each column is appended to once
+        for the whole batch.
+        '''
+        new_rows = []
+        # link: position in new_rows, for links repeated within the batch.
+        new_links = {}
+        for link, row in rows:
+            if link in self.index:
+                self.set_row(self.index[link], row)
+            elif link in new_links:
+                new_rows[new_links[link]] = row
+            else:
+                new_links[link] = len(new_rows)
+                new_rows.append(row)
+        if not new_rows:
+            return
+        for i, column in enumerate(self.data):
+            column.append([row[i] for row in new_rows])
+        first = len(self.index)
+        for link, position in new_links.items():
+            self.index[link] = first + position
+
+    def set_row(self, position, row):
+        for column, cell in zip(self.data, row):
+            column.set(position, cell)
+
+    def update(self, other):
+        '''
+        Adds the rows of another table with the same columns, in their order.
+        Unless some of their links are already in this table, the columns
+        are extended as they are, without building the rows.
+        '''
+        if any(link in self.index for link in other.index):
+            self.add_rows(zip(other.links(), other.rows()))
+            return
+        first = len(self.index)
+        for column, other_column in zip(self.data, other.data):
+            column.extend(other_column)
+        for link, position in other.index.items():
+            self.index[link] = first + position
+
+    def column(self, name):
+        '''
+        Gets the cells of a column, as they were added.
+        '''
+        return self.data[self.columns.index(name)].cells()
+
+    def rows(self):
+        '''
+        Gets the rows of the table, as tuples built from its columns.
+        '''
+        return zip(*[column.cells() for column in self.data])
+
+    def without(self, links):
+        '''
+        Gets a copy of the table without the rows of the given links.
+        '''
+        table = PolicyTable(self.columns)
+        table.add_rows((link, row) for link, row in zip(self.links(), self.rows()) if link not in links)
+        return table
+
+    def numbers(self, name):
+        '''
+        Gets the values of a number column (see NUMBER_COL_NAMES), as an
+        array of floats. Cells that are not numbers are NaN.
+        '''
+        column = self.data[self.columns.index(name)]
+        if not isinstance(column, NumberColumn):
+            raise ValueError(f"{name} is not a number column.")
+        return column.values
+
+    def value_counts(self, name):
+        '''
+        Gets the number of rows of each value of a dictionary-encoded column.
+        '''
+        column = self.data[self.columns.index(name)]
+        if not isinstance(column, DictColumn):
+            raise ValueError(f"{name} is not a dictionary-encoded column.")
+        return {column.values[code]: count for code, count in Counter(column.codes).items()}
@@ -0,0 +1,124 @@
+'''
+# This file contains the class declaration for a product filter.
+# A ProductFilter keeps the products of some funds, states, statuses, schema
+# versions or policy types only (the --fund, --state, --status, --schema and
+# --policy-type options). It only reads the few header tags it needs, so a
+# product is checked before it is souped or scraped, and the products that
+# do not match are never extracted nor written.
+#
+# Policy types are those of the "Policy Type" column: the ProductType of a
+# schema 2.0 product, the type of its policy XML file (see bundle.get_pol_type)
+# for the others. Products are checked with the filter of their file (see
+# for_file), and files of other types are only skipped without being opened
+# when schema 2.0 products are filtered out too.
+# Values are compared ignoring case, e.g. --status open keeps "Open" products.
+'''
+
+from bundle import get_pol_type
+from stream import local_name, get_attr
+
+# Tags read from a product, in the order they are checked. schemaversion
+# is an attribute of the product, the others are the text of a tag in it.
+FILTER_TAGS = ["fundcode", "state", "productstatus", "schemaversion"]
+
+
+def element_text(elem, tag):
+    '''
+    Gets the stripped text of the first tag of an lxml element with the
+    given lower-cased name, or "" if there is none, as find_all_soup does.
+    '''
+    for child in elem.iter():
+        if local_name(child) == tag:
+            return "".join(child.itertext()).strip()
+    return ""
+
+def soup_text(product, tag):
+    '''
+    Gets the stripped text of the first tag of a soup product with the
+    given name, or "" if there is none. The search stops at that tag.
+    '''
+    found = product.find(tag)
+    if found is None:
+        return ""
+    return found.get_text().strip()
+
+
+class ProductFilter():
+    def __init__(self, funds=None, states=None, statuses=None, schemas=None, pol_types=None):
+        # tag: set of the casefolded values kept, for the tags filtered on.
+        self.wanted = {}
+        for tag, values in zip(FILTER_TAGS, (funds, states, statuses, schemas)):
+            if values:
+                self.wanted[tag] = {value.casefold() for value in values}
+        self.pol_types = {value.casefold() for value in pol_types} if pol_types else None
+        # Casefolded type of the policy XML file of the products, see for_file.
+        self.file_type = None
+
+    def __bool__(self):
+        return bool(self.wanted) or self.pol_types is not None
+
+    def spec(self):
+        '''
+        Gets the values kept, as sorted lists by tag, e.g. to hash them.
+        '''
+        spec = {tag: sorted(values) for tag, values in self.wanted.items()}
+        if self.pol_types is not None:
+            spec["policytype"] = sorted(self.pol_types)
+        return spec
+
+    def for_file(self, file_name):
+        '''
+        Gets the filter of the products of a policy XML file, which knows
+        the policy type of the file.
+        '''
+        file_filter = ProductFilter()
+        file_filter.wanted = self.wanted
+        file_filter.pol_types = self.pol_types
+        file_filter.file_type = get_pol_type(file_name).casefold()
+        return file_filter
+
+    def matches_file(self, file_name):
+        '''
+        Checks whether the products of a policy XML file can match, from
+        the policy type of the file. Schema 2.0 products have their own
+        type, so any file can match while they are not filtered out.
+        '''
+        if self.pol_types is None or get_pol_type(file_name).casefold() in self.pol_types:
+            return True
+        schemas = self.wanted.get("schemaversion")
+        return schemas is None or "2.0" in schemas
+
+    def matches_element(self, elem):
+        '''
+        Checks whether a product, as an lxml element, matches the filter.
+        '''
+        for tag, values in self.wanted.items():
+            if tag == "schemaversion":
+                value = get_attr(elem, tag) or ""
+            else:
+                value = element_text(elem, tag)
+            if value.strip().casefold() not in values:
+                return False
+        if self.pol_types is None:
+            return True
+        # The policy type of a schema 2.0 product is its ProductType.
+        if (get_attr(elem, "schemaversion") or "").strip() == "2.0":
+            return element_text(elem, "producttype").casefold() in self.pol_types
+        return self.file_type in self.pol_types
+
+    def matches_soup(self, product):
+        '''
+        Checks whether a product, as a soup tag, matches the filter.
+        '''
+        for tag, values in self.wanted.items():
+            if tag == "schemaversion":
+                value = product.get(tag, "")
+            else:
+                value = soup_text(product, tag)
+            if value.strip().casefold() not in values:
+                return False
+        if self.pol_types is None:
+            return True
+        if product.get("schemaversion", "").strip() == "2.0":
+            return soup_text(product, "producttype").casefold() in self.pol_types
+        return self.file_type in self.pol_types
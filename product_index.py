@@ -0,0 +1,29 @@
+'''
+# This file contains the class declaration for a product index.
+# The scraper asks each product for about 25 different tags, and every
+# find_all call on a soup tag walks the whole product again. A ProductIndex
+# walks the product once, remembers every tag by name and then answers
+# find_all from that index, so all the get_* helpers share a single pass.
+'''
+
+class ProductIndex():
+    def __init__(self, product):
+        self.product = product
+        self.index = {}
+        for tag in product.find_all(True):
+            if tag.name in self.index:
+                self.index[tag.name].append(tag)
+            else:
+                self.index[tag.name] = [tag]
+
+    def find_all(self, tag):
+        '''
+        Gets all the tags with the given name, in document order.
+        '''
+        return self.index.get(tag, [])
+
+    def __getitem__(self, attr):
+        return self.product[attr]
+
+    def __str__(self):
+        return str(self.product)
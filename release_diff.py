@@ -0,0 +1,271 @@
+'''
+# This file compares two releases of the download bundle.
+# Both releases (directories or zip archives, see bundle.py) are scraped with
+# the same schema_2 / schema_3 extraction as xml_parser.py, and their policies
+# are joined on their policy type and id (fund code/product code), as the same
+# id can be used by a Hospital and a General product. The output has a row
+# for every added and removed policy, and a row for every field of DIFF_FIELDS
+# that changed, with the old and new values and their delta.
+#
+# Only the keys of the old release are kept in memory: a digest of the compared
+# fields and the position of the product. The new release is hash joined
+# against them, and the old release is then read a second time to get the old
+# values of the changed and removed policies only.
+#
+# Usage: python release_diff.py privatehealth-04-apr-2019 privatehealth-01-oct-2019.zip --stream
+'''
+
+import sys, hashlib, datetime, argparse
+
+from bundle import open_bundle
+from interning import INTERNER
+from metrics import Progress
+from parse_funds import load_funds
+from policy_store import parse_premium
+from product_index import ProductIndex
+from sinks import SINKS, open_sink
+from xml_parser import SCRAPERS, read_products
+from constants import *
+
+# Policy fields compared between releases, in the order of their diff rows.
+DIFF_FIELDS = ["mo_prem", "status", "excess", "hosp_covered", "hosp_not_covered", \
+               "hosp_limited", "gen_services"]
+# Fields whose values are lists of services.
+LIST_FIELDS = {"hosp_covered", "hosp_not_covered", "hosp_limited", "gen_services"}
+
+
+def get_pol_key(policy):
+    '''
+    Gets the join key of a policy of either schema: its policy type and
+    its id (fund code/product code).
+    '''
+    return policy.pol_type, policy.pdf_link[len(DOWNLOAD_LINK):]
+
+def cover_list(services):
+    '''
+    Gets a list of hospital services as a sorted tuple, or () if the
+    policy has no hospital cover.
+    '''
+    if isinstance(services, list):
+        return tuple(sorted(services))
+    return ()
+
+def covered_general(gen_services):
+    '''
+    Gets the names of the covered general services of a policy.
+    '''
+    if not isinstance(gen_services, dict):
+        return ()
+    return tuple(sorted(name for name in gen_services if gen_services[name].cover == "true"))
+
+def diff_record(policy):
+    '''
+    Gets the values of the DIFF_FIELDS of a policy, as a tuple.
+    '''
+    hosp_cover = policy.hosp_cover
+    return (policy.mo_prem, policy.status, policy.excess, cover_list(hosp_cover.covered), \
+            cover_list(hosp_cover.not_covered), cover_list(hosp_cover.limited_cover), \
+            covered_general(policy.gen_services))
+
+def parse_excess(excess):
+    '''
+    Gets the amounts of the excesses of a policy, as {excess name: number},
+    from the "<name> is $<amount>" lines of get_excess. Waivers and amounts
+    that are not numbers are left out.
+    '''
+    amounts = {}
+    for line in excess.splitlines():
+        name, sep, amount = line.partition(" is $")
+        if not sep:
+            continue
+        try:
+            amounts[name] = float(amount)
+        except ValueError:
+            pass
+    return amounts
+
+def record_digest(record):
+    return hashlib.blake2b(repr(record).encode(), digest_size=8).digest()
+
+def iter_policies(bundle, funds_dict, backend, stream, wanted=None):
+    '''
+    Yields (file index, position, policy) for the products of a release.
+    With wanted, {file index: set of positions}, only those products are
+    scraped. Streamed policies must be used before the next one is read.
+    '''
+    for file_index, file in enumerate(bundle.policy_files()):
+        if wanted is not None and file_index not in wanted:
+            continue
+        product_count, products = read_products(bundle, file, stream, backend)
+        progress = Progress(f"Comparing product {{done}} of {{total}} from {file}.", product_count)
+        for position, product in enumerate(products):
+            progress.update()
+            if wanted is not None and position not in wanted[file_index]:
+                continue
+            if backend == "soup":
+                product = ProductIndex(product)
+            policy = SCRAPERS[backend](product, file, funds_dict, lazy=True)
+            if policy is not None:
+                yield file_index, position, policy
+        progress.close()
+        # Nothing is kept from the file, so its strings need not be shared.
+        INTERNER.clear()
+
+def index_release(bundle, funds_dict, backend, stream):
+    '''
+    Gets the keys of a release: {(pol_type, pol_id): (digest, file index, position)}.
+    The first product of a key is used, later ones are skipped.
+    Returns the keys and the number of products skipped.
+    '''
+    keys = {}
+    duplicates = 0
+    for file_index, position, policy in iter_policies(bundle, funds_dict, backend, stream):
+        pol_key = get_pol_key(policy)
+        if pol_key in keys:
+            duplicates += 1
+            continue
+        keys[pol_key] = (record_digest(diff_record(policy)), file_index, position)
+    return keys, duplicates
+
+def join_values(value):
+    if isinstance(value, tuple):
+        return ", ".join(value)
+    return value
+
+def field_delta(field, old, new):
+    '''
+    Gets the delta of a field: the premium change for mo_prem, the change
+    of each excess amount for excess, the services added and removed for
+    the lists of services, nothing for text fields.
+    '''
+    if field == "mo_prem":
+        old_prem = parse_premium(old)
+        new_prem = parse_premium(new)
+        if old_prem is None or new_prem is None:
+            return ""
+        delta = new_prem - old_prem
+        if not old_prem:
+            return f"{delta:+.2f}"
+        return f"{delta:+.2f} ({delta / old_prem:+.1%})"
+    if field == "excess":
+        old_amounts = parse_excess(old)
+        new_amounts = parse_excess(new)
+        parts = []
+        for name, amount in new_amounts.items():
+            if name not in old_amounts:
+                parts.append(f"+ {name} {amount:.2f}")
+            elif amount != old_amounts[name]:
+                parts.append(f"{name} {amount - old_amounts[name]:+.2f}")
+        for name, amount in old_amounts.items():
+            if name not in new_amounts:
+                parts.append(f"- {name} {amount:.2f}")
+        return "; ".join(parts)
+    if field in LIST_FIELDS:
+        parts = []
+        added = [s for s in new if s not in old]
+        removed = [s for s in old if s not in new]
+        if added:
+            parts.append("+ " + ", ".join(added))
+        if removed:
+            parts.append("- " + ", ".join(removed))
+        return "; ".join(parts)
+    return ""
+
+def changed_rows(pol_key, name, fund, old_record, new_record):
+    '''
+    Gets the diff rows of the fields that changed between two records.
+    '''
+    rows = []
+    for field, old, new in zip(DIFF_FIELDS, old_record, new_record):
+        if old != new:
+            rows.append(["changed", pol_key[1], pol_key[0], name, fund, field, join_values(old), \
+                         join_values(new), field_delta(field, old, new)])
+    return rows
+
+def diff_releases(old_bundle, new_bundle, sink, backend="soup", stream=False):
+    '''
+    Writes the diff rows (DIFF_COL_NAMES) of two releases to a sink.
+    Returns the number of added, removed, changed and unchanged policies.
+    '''
+    counts = {"added": 0, "removed": 0, "changed": 0, "unchanged": 0}
+    print(f"-- Indexing {old_bundle.path} --")
+    old_funds = load_funds(bundle=old_bundle)
+    old_keys, duplicates = index_release(old_bundle, old_funds, backend, stream)
+
+    # Hash join of the new release against the old keys. Only the new
+    # records of the changed policies are kept, until their old ones are read.
+    print(f"-- Comparing {new_bundle.path} --")
+    new_funds = load_funds(bundle=new_bundle)
+    seen = set()
+    changed = {}
+    for _, _, policy in iter_policies(new_bundle, new_funds, backend, stream):
+        pol_key = get_pol_key(policy)
+        if pol_key in seen:
+            duplicates += 1
+            continue
+        seen.add(pol_key)
+        record = diff_record(policy)
+        if pol_key not in old_keys:
+            counts["added"] += 1
+            sink.write_row(["added", pol_key[1], pol_key[0], policy.pol_name, policy.fund_name, \
+                            "mo_prem", "", policy.mo_prem, ""])
+            continue
+        if record_digest(record) == old_keys[pol_key][0]:
+            counts["unchanged"] += 1
+        else:
+            changed[pol_key] = record
+
+    # The old values of the changed and removed policies.
+    wanted = {}
+    for pol_key, (_, file_index, position) in old_keys.items():
+        if pol_key in changed or pol_key not in seen:
+            wanted.setdefault(file_index, set()).add(position)
+    if wanted:
+        print(f"-- Reading the old values from {old_bundle.path} --")
+    for _, _, policy in iter_policies(old_bundle, old_funds, backend, stream, wanted):
+        pol_key = get_pol_key(policy)
+        if pol_key not in seen:
+            counts["removed"] += 1
+            sink.write_row(["removed", pol_key[1], pol_key[0], policy.pol_name, policy.fund_name, \
+                            "mo_prem", policy.mo_prem, "", ""])
+            continue
+        rows = changed_rows(pol_key, policy.pol_name, policy.fund_name, diff_record(policy), \
+                            changed.pop(pol_key))
+        counts["changed"] += 1
+        for row in rows:
+            sink.write_row(row)
+
+    if duplicates:
+        print(f"Skipped {duplicates} products whose policy type and id were already seen in their release.")
+    return counts
+
+def parse_args():
+    '''
+    Parses the command line options.
+    '''
+    parser = argparse.ArgumentParser(description="Compares the policies of two releases.")
+    parser.add_argument("old", metavar="OLD", help="directory or zip archive of the old release")
+    parser.add_argument("new", metavar="NEW", help="directory or zip archive of the new release")
+    parser.add_argument("--backend", choices=sorted(SCRAPERS), default="soup", \
+        help="read the fields from a soup of each product, or with precompiled XPath " \
+             "expressions on the XML (default: soup)")
+    parser.add_argument("--stream", action="store_true", \
+        help="read products one at a time instead of souping whole files")
+    parser.add_argument("--format", choices=sorted(SINKS), default="xlsx", \
+        help="output format of the diff (default: xlsx)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    dest = f"{sys.path[0]}/results/diff " + datetime.datetime.now().strftime("%d %B %Y at %H.%M")
+    sink = open_sink(args.format, dest, DIFF_COL_NAMES)
+    with open_bundle(args.old) as old_bundle, open_bundle(args.new) as new_bundle:
+        counts = diff_releases(old_bundle, new_bundle, sink, args.backend, args.stream)
+    sink.close()
+    print(f"{counts['added']} added, {counts['removed']} removed, {counts['changed']} changed " \
+          f"and {counts['unchanged']} unchanged policies.")
+    print(f"-- Diff written to {sink.destination} --")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+'''
+# This file contains the class declarations for the output sinks.
+# A sink receives the rows built by policy_row, one at a time or as a whole
+# PolicyTable read column by column (see policy_table.py), and writes them
+# out in its own format. Every sink uses the column layout declared
+# in constants.py (COL_NAMES and the COL_* indexes), so the same row can
+# go to an excel file, a csv file, a sqlite database or a parquet file.
+# Summary exports use SUMMARY_COL_NAMES instead, given as columns.
+# XlsxSink is the default and gives the same excel files as before.
+'''
+
+import csv
+import sqlite3
+from abc import ABC, abstractmethod
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from policy_table import DictColumn
+from constants import *
+
+# Parquet output is optional, it is only available if pyarrow is installed.
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Shared by every header cell instead of one Font per cell.
+HEADER_FONT = Font(size = 14, bold = True)
+
+# Number of rows sent to sqlite / parquet at a time.
+BATCH_SIZE = 1000
+
+
+def create_excel(columns=COL_NAMES):
+    '''
+    Sets up a write-only Excel Category Sheet with Bold titles.
+    Rows are appended one at a time and the workbook is saved once,
+    so the cells of earlier rows are not kept in memory.
+    '''
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    #Creates Bold Column Titles
+    header = []
+    for name in columns:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = HEADER_FONT
+        header.append(cell)
+    ws.append(header)
+    return wb, ws
+
+
+class Sink(ABC):
+    '''
+    Base class for all output sinks.
+    '''
+    extension = ""
+
+    def __init__(self, destination, columns=COL_NAMES):
+        self.destination = destination
+        self.columns = columns
+
+    @abstractmethod
+    def write_row(self, row):
+        '''
+        Writes a single row, given as a list with one value per column.
+        '''
+
+    def write_table(self, table):
+        '''
+        Writes every row of a PolicyTable with the same columns.
+        '''
+        for row in table.rows():
+            self.write_row(row)
+
+    @abstractmethod
+    def close(self):
+        '''
+        Flushes everything that is left and closes the output.
+        '''
+
+
+class XlsxSink(Sink):
+    '''
+    Writes rows to an excel file, using a write-only workbook.
+    '''
+    extension = "xlsx"
+
+    def __init__(self, destination, columns=COL_NAMES):
+        super().__init__(destination, columns)
+        self.wb, self.ws = create_excel(columns)
+
+    def write_row(self, row):
+        self.ws.append(row)
+
+    def close(self):
+        self.wb.save(self.destination)
+
+
+class CsvSink(Sink):
+    '''
+    Writes rows to a csv file as they come in.
+    '''
+    extension = "csv"
+
+    def __init__(self, destination, columns=COL_NAMES):
+        super().__init__(destination, columns)
+        self.file = open(destination, "w", newline="", encoding="utf-8")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write_row(self, row):
+        self.writer.writerow(row)
+
+    def write_table(self, table):
+        self.writer.writerows(table.rows())
+
+    def close(self):
+        self.file.close()
+
+
+class SqliteSink(Sink):
+    '''
+    Writes rows to the policies table of a sqlite database.
+    Rows are inserted in batches of BATCH_SIZE. A policies table already
+    in the database is replaced, as the other sinks overwrite their file.
+    '''
+    extension = "sqlite"
+
+    def __init__(self, destination, columns=COL_NAMES):
+        super().__init__(destination, columns)
+        self.conn = sqlite3.connect(destination)
+        definitions = ", ".join(f'"{name}" TEXT' for name in columns)
+        self.conn.execute("DROP TABLE IF EXISTS policies")
+        self.conn.execute(f"CREATE TABLE policies ({definitions})")
+        marks = ", ".join("?" for _ in columns)
+        self.insert = f"INSERT INTO policies VALUES ({marks})"
+        self.batch = []
+
+    def write_row(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany(self.insert, self.batch)
+        self.batch = []
+
+    def write_table(self, table):
+        self.flush()
+        self.conn.executemany(self.insert, table.rows())
+
+    def close(self):
+        self.flush()
+        self.conn.commit()
+        self.conn.close()
+
+
+class ParquetSink(Sink):
+    '''
+    Writes rows to a parquet file, one row group of BATCH_SIZE rows at a time.
+    Requires pyarrow.
+    '''
+    extension = "parquet"
+
+    def __init__(self, destination, columns=COL_NAMES):
+        if pyarrow is None:
+            raise ImportError("pyarrow is required for parquet output.")
+        super().__init__(destination, columns)
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(destination, self.schema)
+        self.batch = []
+
+    def write_row(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        columns = [pyarrow.array([row[i] for row in self.batch], pyarrow.string()) \
+                   for i in range(len(self.columns))]
+        self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+        self.batch = []
+
+    def write_table(self, table):
+        self.flush()
+        columns = []
+        for name, column in zip(table.columns, table.data):
+            if isinstance(column, DictColumn):
+                # Each distinct value is only converted once.
+                values = pyarrow.array(column.values, pyarrow.string())
+                codes = pyarrow.array(column.codes, pyarrow.uint32())
+                columns.append(pyarrow.DictionaryArray.from_arrays(codes, values).dictionary_decode())
+            else:
+                columns.append(pyarrow.array(column.cells(), pyarrow.string()))
+        if columns and len(columns[0]):
+            self.writer.write_table(pyarrow.Table.from_arrays(columns, schema=self.schema))
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+SINKS = {
+    "xlsx": XlsxSink,
+    "csv": CsvSink,
+    "sqlite": SqliteSink,
+    "parquet": ParquetSink,
+}
+
+def open_sink(output_format, destination, columns=COL_NAMES):
+    '''
+    Opens the sink for an output format. The file extension of the
+    format is added to destination.
+    '''
+    sink_class = SINKS[output_format]
+    return sink_class(f"{destination}.{sink_class.extension}", columns)
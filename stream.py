@@ -0,0 +1,122 @@
+'''
+# This file contains the streaming reader for the policy XML files.
+# Instead of building a soup for the whole document, the file is read with
+# lxml's iterparse and each <Product> element is handed over on its own.
+# Every product is turned into a small soup so that schema_2 and schema_3
+# can scrape it as before, and it is released once it has been scraped.
+# Peak memory is then bounded by the largest product, not the file size.
+#
+# The readers below take a file name or an open binary file, such as a member
+# of a Bundle. An open file is closed once its products have been read, or
+# when the reader is closed before that.
+'''
+
+from contextlib import closing
+from bs4 import BeautifulSoup
+from lxml import etree
+
+
+def local_name(elem):
+    '''
+    Gets the lower-cased tag name of an lxml element, without namespace.
+    This matches the tag names the "lxml" soup parser produces.
+    '''
+    tag = elem.tag
+    if not isinstance(tag, str):
+        return ""
+    return tag.rpartition('}')[2].lower()
+
+def get_attr(elem, name):
+    '''
+    Gets an attribute from an lxml element, ignoring case.
+    Returns None if the attribute does not exist.
+    '''
+    for key, value in elem.attrib.items():
+        if key.rpartition('}')[2].lower() == name:
+            return value
+    return None
+
+def get_product_count(xml_file_name):
+    '''
+    Gets the product count declared on the <Products> element.
+    Only the start of the file is read.
+    '''
+    for _, elem in etree.iterparse(xml_file_name, events=('start',), huge_tree=True):
+        if local_name(elem) == 'products':
+            return get_attr(elem, 'count')
+    return "Unknown"
+
+def make_soup(elem):
+    '''
+    Turns a single lxml product element into a soup product tag.
+    '''
+    return soup_from_xml(etree.tostring(elem, with_tail=False))
+
+def soup_from_xml(xml):
+    '''
+    Turns the XML of a single product into a soup product tag.
+    '''
+    return BeautifulSoup(xml, "lxml").find('product')
+
+def element_from_xml(xml):
+    '''
+    Turns the XML of a single product into an lxml product element.
+    '''
+    return etree.fromstring(xml)
+
+def iter_product_elements(xml_file_name, start=0):
+    '''
+    Yields every <Product> lxml element of an XML file in document order.
+    Each element is cleared after it has been yielded, and the elements
+    before it are removed from the tree so memory stays flat.
+    If start is given, only the products from that position are yielded.
+    '''
+    try:
+        context = etree.iterparse(xml_file_name, events=('end',), huge_tree=True)
+        position = 0
+        for _, elem in context:
+            if local_name(elem) != 'product':
+                continue
+            if position >= start:
+                yield elem
+            position += 1
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        del context
+    finally:
+        if hasattr(xml_file_name, "close"):
+            xml_file_name.close()
+
+def iter_product_batches(xml_file_name, batch_size, keep=None):
+    '''
+    Yields the XML of the products of an XML file, as lists of at most
+    batch_size bytes strings, e.g. to send them to other processes.
+    With keep, only the products it is true for are yielded.
+    '''
+    batch = []
+    with closing(iter_product_elements(xml_file_name)) as elems:
+        for elem in elems:
+            if keep is not None and not keep(elem):
+                continue
+            batch.append(etree.tostring(elem, with_tail=False))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+def iter_products(xml_file_name, start=0, keep=None):
+    '''
+    Yields every product of an XML file as a soup tag, one at a time.
+    If start is given, only the products from that position are
+    yielded, the ones before it are skipped unsouped.
+    With keep, the products it is false for are not souped, None is
+    yielded in their place so the positions of the others stay the same.
+    '''
+    with closing(iter_product_elements(xml_file_name, start)) as elems:
+        for elem in elems:
+            if keep is not None and not keep(elem):
+                yield None
+            else:
+                yield make_soup(elem)
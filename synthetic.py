@@ -0,0 +1,312 @@
+'''
+# This file generates a synthetic download bundle for benchmarking.
+# The real bundle has a fixed size, so to see how the scraper scales we
+# write schema 2.0 and 3.0 policy XML files and a matching funds file with
+# as many products as we like. The files contain every element the scraper
+# reads (excesses, hospital cover and medical services, waiting periods,
+# general health services and benefit limits, product ambulance and
+# preferred provider services), laid out the way xml_parser expects them.
+#
+# Like the real data, products are published as variants: every fund has a
+# few covers, and each cover is repeated across states, scales and excesses.
+#
+# The bundle is written to a directory of its own, e.g. under /tmp, and read
+# with xml_parser.py --input. It is never written to XML_FILES_DIR, where it
+# would overwrite the funds file of the real release.
+#
+# Usage: python synthetic.py /tmp/synthetic --products 100000
+'''
+
+import sys, os, argparse, random
+from xml.sax.saxutils import escape, quoteattr
+
+from constants import *
+
+STATES = ["NSW", "VIC", "QLD", "SA", "WA", "TAS", "ACT", "NT"]
+SCALES = ["Single", "Couple", "Family", "SingleParentFamily"]
+CATEGORIES = ["Singles", "Couples", "Family", "SingleParent"]
+STATUSES = ["Open", "Open", "Open", "Closed"]
+
+# Titles of the general services, one for every general service column.
+GENERAL_SERVICES = [
+    "DentalGeneral", "DentalMajor", "Endodontic", "Orthodontic", "Optical",
+    "NonPBSPharmaceutical", "Physiotherapy", "Chiropractic", "Podiatry",
+    "Psychology", "Acupuncture", "Naturopathy", "RemedialMassage",
+    "HearingAids", "BloodGlucoseMonitors",
+]
+
+MEDICAL_SERVICES = [
+    "Rehabilitation", "Psychiatric", "Palliative", "BrainAndNervousSystem",
+    "EyeNotCataracts", "EarNoseAndThroat", "TonsilsAdenoidsGrommets",
+    "BoneJointMuscle", "JointReconstructions", "KidneyAndBladder",
+    "MaleReproductive", "DigestiveSystem", "HerniaAndAppendix",
+    "GastrointestinalEndoscopy", "GynaecologyAndRelated", "MiscarriageAndTermination",
+    "ChemotherapyRadiotherapyImmunotherapy", "PainManagement", "SkinCare",
+    "BreastSurgery", "DiabetesManagement", "HeartAndVascularSystem",
+    "LungAndChest", "BloodDisorders", "BackNeckSpine", "PlasticAndReconstructive",
+    "DentalSurgery", "PodiatricSurgery", "ImplantationOfHearingDevices",
+    "CataractSurgery", "JointReplacements", "DialysisForChronicKidneyFailure",
+    "PregnancyAndBirth", "AssistedReproductiveServices", "WeightLossSurgery",
+    "InsulinPumps", "PainManagementWithDevice", "SleepStudies",
+]
+
+COVER_LEVELS = ["Covered", "Covered", "Covered", "Restricted", "NotCovered"]
+
+# Number of distinct covers per fund. Products are variants of these.
+COVERS_PER_FUND = 8
+# Every PRODUCT_TYPE_EVERY-th schema 2.0 product has a ProductType other than
+# the type of its file, as the products of a file need not all be of its type.
+PRODUCT_TYPE_EVERY = 5
+
+
+def element(name, text="", **attrs):
+    '''
+    Gets the XML of an element with escaped text and attributes.
+    '''
+    attr_str = "".join(f" {key}={quoteattr(str(value))}" for key, value in attrs.items())
+    return f"<{name}{attr_str}>{escape(str(text))}</{name}>"
+
+def fund_codes(n_funds):
+    '''
+    Gets n_funds distinct three letter fund codes.
+    '''
+    codes = []
+    for i in range(n_funds):
+        codes.append("".join(chr(ord('A') + (i // 26 ** k) % 26) for k in (2, 1, 0)))
+    return codes
+
+def make_fund(rand, code):
+    '''
+    Gets the XML of a single fund.
+    '''
+    parts = [element("FundCode", code), element("FundName", f"Synthetic Health Fund {code}")]
+    parts.append("<PreferredProviders>")
+    for state in STATES:
+        covered = rand.choice(["Covered", "Covered", "NotCovered"])
+        parts.append(f"<PreferredProvider Covered=\"{covered}\" State=\"{state}\">"
+                     f"{element('FreeText', f'{code} has agreements with providers in {state}.')}"
+                     "</PreferredProvider>")
+    parts.append("</PreferredProviders>")
+    parts.append(f"<Ambulance CallOutFees={quoteattr(rand.choice(['Covered', 'NotCovered', 'Partial']))}>")
+    parts.append(element("WaitingPeriodEmergency", rand.choice([0, 1, 2]), Unit="Day"))
+    parts.append(element("AmbulanceServiceLimitEmergency", rand.choice(["Unlimited", "5000", "10000"])))
+    parts.append("<Details>")
+    for state in STATES:
+        parts.append(element("Detail", f"Ambulance cover in {state} as per {code} fund rules.", State=state))
+    parts.append("</Details></Ambulance>")
+    if rand.random() < 0.3:
+        parts.append("<Restrictions>")
+        parts.append(element("RestrictionParagraph", f"Only available to members of the {code} association."))
+        parts.append("</Restrictions>")
+    return "<Fund>" + "".join(parts) + "</Fund>\n"
+
+def write_funds_file(file_name, codes, seed=0):
+    '''
+    Writes a funds XML file with a fund for each code.
+    '''
+    rand = random.Random(seed)
+    with open(file_name, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.write(f'<Funds Count="{len(codes)}">\n')
+        for code in codes:
+            out.write(make_fund(rand, code))
+        out.write("</Funds>\n")
+
+def make_hospital_cover(rand, schema):
+    '''
+    Gets the XML of a hospital cover, with its waiting periods.
+    '''
+    if schema == '3.0':
+        attrs = {
+            "AccidentCover": rand.choice(["true", "false"]),
+            "TravelOrAccommodationsBenefit": rand.choice(["true", "false"]),
+        }
+    else:
+        attrs = {}
+    attr_str = "".join(f" {key}={quoteattr(value)}" for key, value in attrs.items())
+    parts = [f"<HospitalCover{attr_str}>"]
+    parts.append(element("Accommodation", rand.choice(["Shared room", "Private room"])))
+    parts.append(element("Doctors", rand.choice(["Gap cover", "No gap"])))
+    parts.append("<MedicalServices>")
+    for title in MEDICAL_SERVICES:
+        parts.append(element("MedicalService", "", Title=title, Cover=rand.choice(COVER_LEVELS)))
+    parts.append("</MedicalServices>")
+    parts.append("<WaitingPeriods>")
+    for title, period in (("PreExisting", 12), ("Psychiatric", 2), ("Obstetric", 12), ("Other", 2)):
+        parts.append(element("WaitingPeriod", period, Title=title, Unit="Month"))
+    parts.append("</WaitingPeriods>")
+    parts.append(element("OtherProductFeatures", "Includes a no claims bonus after 2 years."))
+    if rand.random() < 0.4:
+        parts.append(element("CoPayments", f"${rand.choice([50, 75, 100])} per day, up to 5 days."))
+    parts.append("</HospitalCover>")
+    return "".join(parts)
+
+def make_general_cover(rand, schema):
+    '''
+    Gets the XML of the general health services and their benefit limits.
+    '''
+    covered = []
+    parts = ["<GeneralHealthServices>"]
+    for title in GENERAL_SERVICES:
+        if rand.random() < 0.2:
+            parts.append(f"<GeneralHealthService Title=\"{title}\" Covered=\"false\"></GeneralHealthService>")
+            continue
+        covered.append(title)
+        parts.append(f"<GeneralHealthService Title=\"{title}\" Covered=\"true\">")
+        parts.append(element("WaitingPeriod", rand.choice([2, 6, 12]), Unit="Month"))
+        parts.append("<Benefits>")
+        for item in rand.sample(range(10, 990), 2):
+            parts.append(element("Benefit", rand.choice([20, 35, 60, 80]), Item=f"{item:03d}", Type="Dollars"))
+        parts.append("</Benefits></GeneralHealthService>")
+    parts.append("</GeneralHealthServices>")
+
+    parts.append("<BenefitLimits>")
+    # Services are grouped into shared limits, as funds usually do.
+    for start in range(0, len(covered), 3):
+        parts.append(f"<BenefitLimit Title=\"Limit{start // 3 + 1}\">")
+        parts.append(element("LimitPerPerson", rand.choice([300, 500, 800])))
+        parts.append(element("LimitPerPolicy", rand.choice([1000, 1500, 2000])))
+        for title in covered[start:start + 3]:
+            sublimits = rand.choice(["true", "false"])
+            parts.append(element("Service", title, SubLimitsApply=sublimits))
+        parts.append("</BenefitLimit>")
+    if schema == '2.0':
+        parts.append("<BenefitLimit Title=\"Ambulance\">")
+        parts.append(element("AnnualLimit", rand.choice(["Unlimited", "1000"])))
+        parts.append("</BenefitLimit>")
+    parts.append("</BenefitLimits>")
+    if schema == '2.0':
+        parts.append("<GeneralHealthAmbulance Cover=\"Full\">")
+        parts.append(element("WaitingPeriod", 1, Unit="Day"))
+        parts.append("</GeneralHealthAmbulance>")
+    return "".join(parts)
+
+def make_cover(rand, schema, pol_type):
+    '''
+    Gets the XML shared by all variants of a cover.
+    '''
+    cover = ""
+    if pol_type != "General":
+        cover += make_hospital_cover(rand, schema)
+    if pol_type != "Hospital":
+        cover += make_general_cover(rand, schema)
+    return cover
+
+def make_product(rand, schema, pol_type, code, number, cover):
+    '''
+    Gets the XML of a single product, a variant of the given cover.
+    '''
+    state = rand.choice(STATES)
+    adults = rand.choice([1, 2])
+    prod_code = f"{number:07d}{adults}{rand.choice('ABCDEFGH')}"
+    parts = [f"<Product ProductCode=\"{prod_code}\" SchemaVersion=\"{schema}\">"]
+    parts.append(element("Name", f"{code} {pol_type} Cover {number % COVERS_PER_FUND}"))
+    parts.append(element("FundCode", code))
+    parts.append(element("ProductStatus", rand.choice(STATUSES)))
+    parts.append(element("DateIssued", "2019-04-01"))
+    parts.append(element("State", state))
+    if schema == '3.0':
+        parts.append(element("Scale", rand.choice(SCALES)))
+    else:
+        parts.append(element("Category", rand.choice(CATEGORIES)))
+        product_type = pol_type
+        if number % PRODUCT_TYPE_EVERY == PRODUCT_TYPE_EVERY - 1:
+            product_type = "Hospital" if pol_type != "Hospital" else "Combined"
+        parts.append(element("ProductType", product_type))
+    parts.append(element("Corporate", "", Atomic=rand.choice(["true", "false"])))
+    parts.append(element("PremiumNoRebate", f"{rand.uniform(40, 600):.2f}"))
+    parts.append(element("MedicareLevySurchargeExempt", rand.choice(["true", "false"])))
+    parts.append("<Excesses>")
+    if pol_type != "General":
+        excess = rand.choice([0, 250, 500, 750])
+        parts.append(element("ExcessPerAdmission", excess))
+        parts.append(element("ExcessPerPolicy", excess * 2))
+        if rand.random() < 0.5:
+            parts.append(element("ExcessWaivers", "Children under 18.\n"))
+    parts.append("</Excesses>")
+    if schema == '3.0':
+        parts.append(element("AgeBasedDiscount", "", Available=rand.choice(["true", "false"])))
+    parts.append(cover)
+    if schema == '3.0':
+        if rand.random() < 0.7:
+            parts.append(element("ProductPreferredProviderServices", "", UseFund="true"))
+        else:
+            parts.append(element("ProductPreferredProviderServices", "Members choose any provider.", UseFund="false"))
+        if rand.random() < 0.8:
+            parts.append(element("ProductAmbulance", "", UseFund="true"))
+        else:
+            parts.append(element("ProductAmbulance", "Ambulance cover through state scheme.", UseFund="false"))
+    else:
+        parts.append(element("PreferredProviderServices", "Members choose any provider."))
+    parts.append(element("OtherServices", "Health management programs."))
+    parts.append("</Product>\n")
+    return "".join(parts)
+
+def write_policy_file(file_name, n_products, schema, pol_type, codes, seed=0):
+    '''
+    Writes a policy XML file with n_products products of the given
+    schema version and policy type, spread over the funds in codes.
+    Products are written one at a time, so any size fits in memory.
+    '''
+    rand = random.Random(seed)
+    covers = {}
+    with open(file_name, "w", encoding="utf-8") as out:
+        out.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        out.write(f'<Products Count="{n_products}">\n')
+        for number in range(n_products):
+            code = codes[number % len(codes)]
+            key = (code, number % COVERS_PER_FUND)
+            if key not in covers:
+                covers[key] = make_cover(rand, schema, pol_type)
+            out.write(make_product(rand, schema, pol_type, code, number, covers[key]))
+        out.write("</Products>\n")
+
+# Policy files of a synthetic bundle, as (policy type, schema version, share of products).
+BUNDLE_FILES = [
+    ("Hospital", "3.0", 0.3),
+    ("General", "3.0", 0.2),
+    ("Combined", "3.0", 0.3),
+    ("Combined", "2.0", 0.2),
+]
+
+def generate_bundle(directory, n_products, n_funds=30, seed=0):
+    '''
+    Writes a funds file and a policy file for each entry of BUNDLE_FILES
+    into directory, with n_products products in total.
+    Returns the names of the policy files.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    codes = fund_codes(n_funds)
+    write_funds_file(os.path.join(directory, FUND_FILE_NAME), codes, seed)
+    files = []
+    for n_file, (pol_type, schema, share) in enumerate(BUNDLE_FILES):
+        file = f"{pol_type} Synthetic {schema}.xml"
+        write_policy_file(os.path.join(directory, file), max(1, int(n_products * share)), \
+                          schema, pol_type, codes, seed + n_file + 1)
+        files.append(file)
+    return files
+
+def parse_args():
+    '''
+    Parses the command line options.
+    '''
+    parser = argparse.ArgumentParser(description="Generates a synthetic download bundle.")
+    parser.add_argument("directory", help="directory the XML files are written to")
+    parser.add_argument("--products", type=int, default=1000, metavar="N", \
+        help="total number of products over all policy files (default: 1000)")
+    parser.add_argument("--funds", type=int, default=30, metavar="N", \
+        help="number of funds (default: 30)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    args = parser.parse_args()
+    if os.path.abspath(args.directory) == os.path.abspath(f"{sys.path[0]}/{XML_FILES_DIR}"):
+        parser.error(f"the synthetic bundle cannot be written to {XML_FILES_DIR}")
+    return args
+
+def main():
+    args = parse_args()
+    files = generate_bundle(args.directory, args.products, args.funds, args.seed)
+    print(f"Wrote {FUND_FILE_NAME} and {len(files)} policy files to {args.directory}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+'''
+# This file contains the fixtures shared by the tests.
+# The scraper modules are imported from the directory above. The end to end
+# tests run xml_parser.py on a small synthetic bundle (see synthetic.py), from
+# a copy of the sources in a temporary directory, so the results and cache
+# directories of a run never mix with those of another run or of the repo.
+'''
+
+import os, re, sys, csv, glob, json, shutil, subprocess
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import generate_bundle
+
+# Products of the synthetic bundle, over its four policy files.
+BUNDLE_PRODUCTS = 120
+# Funds of the synthetic bundle.
+BUNDLE_FUNDS = 8
+# Output file name, see xml_parser.open_results: the policy file name
+# without ".xml", then the date of the run.
+OUTPUT_NAME = r"(.*?)\d\d [A-Z][a-z]+ \d{4} at \d\d\.\d\d\.csv$"
+
+
+@pytest.fixture(scope="session")
+def bundle(tmp_path_factory):
+    '''
+    Directory of a small synthetic bundle, shared by every test.
+    '''
+    directory = str(tmp_path_factory.mktemp("bundle"))
+    generate_bundle(directory, BUNDLE_PRODUCTS, BUNDLE_FUNDS)
+    return directory
+
+def read_results(results_dir):
+    '''
+    Gets the csv outputs of a run, as {output name without its date: rows
+    with header}.
+    '''
+    outputs = {}
+    for path in glob.glob(os.path.join(results_dir, "*.csv")):
+        name = re.match(OUTPUT_NAME, os.path.basename(path)).group(1)
+        with open(path, newline="", encoding="utf-8") as csv_file:
+            outputs[name] = list(csv.reader(csv_file))
+    return outputs
+
+
+class Scraper():
+    '''
+    Runs xml_parser.py from its own copy of the sources, so it has its own
+    results and cache directories.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        for name in os.listdir(ROOT):
+            if name.endswith(".py"):
+                shutil.copy(os.path.join(ROOT, name), directory)
+        os.makedirs(os.path.join(directory, "results"))
+        self.output = ""
+        self.metrics = {}
+
+    def run(self, input_path, *args):
+        '''
+        Scrapes input_path to csv files with the given options.
+        Returns the outputs of the run, see read_results. The printed
+        output and the metrics of the run are kept in output and metrics.
+        '''
+        results_dir = os.path.join(self.directory, "results")
+        os.makedirs(results_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(results_dir, "*")):
+            os.remove(path)
+        done = self.scrape(input_path, *args)
+        assert done.returncode == 0, done.stderr
+        with open(os.path.join(self.directory, "metrics.json")) as metrics:
+            self.metrics = json.load(metrics)
+        return read_results(results_dir)
+
+    def run_interrupted(self, input_path, *args):
+        '''
+        Scrapes input_path without a results directory, so the run stops
+        with an error once the first output file is written.
+        '''
+        shutil.rmtree(os.path.join(self.directory, "results"), ignore_errors=True)
+        done = self.scrape(input_path, *args)
+        assert done.returncode != 0
+
+    def scrape(self, input_path, *args):
+        done = subprocess.run([sys.executable, "xml_parser.py", "--input", input_path, \
+                               "--format", "csv", "--metrics", "metrics.json", *args], \
+                              cwd=self.directory, capture_output=True, text=True)
+        self.output = done.stdout
+        return done
+
+    def checkpoint_file(self):
+        return os.path.join(self.directory, "cache", "checkpoints.sqlite")
+
+
+@pytest.fixture
+def scraper(tmp_path):
+    return Scraper(str(tmp_path))
+
+@pytest.fixture(scope="session")
+def serial_output(bundle, tmp_path_factory):
+    '''
+    Outputs of a serial full run on the bundle, the reference of the other modes.
+    '''
+    return Scraper(str(tmp_path_factory.mktemp("serial"))).run(bundle, "--no-cache")
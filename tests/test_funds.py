@@ -0,0 +1,62 @@
+'''
+FundRegistry lookups, and scrapes of products whose fund is not in the funds file.
+'''
+
+import os, shutil
+
+from lxml import etree
+import pytest
+
+from metrics import METRICS
+from parse_funds import parse_funds_file, FundRegistry
+from constants import *
+
+
+@pytest.fixture
+def registry(bundle):
+    return FundRegistry(parse_funds_file(os.path.join(bundle, FUND_FILE_NAME)))
+
+def test_lookups_of_known_funds(registry):
+    METRICS.take()
+    assert "AAA" in registry and len(registry) == 8
+    assert registry.get("AAA").code == "AAA"
+    assert registry.ambulance_details("AAA", "NSW")[2] == "Ambulance cover in NSW as per AAA fund rules."
+    assert registry.ambulance_details("AAA", "XX")[2] == "Not found."
+    assert registry.provider("AAA", "XX") is None
+    _, counts = METRICS.take()
+    assert counts == {"fund_registry_hits": 4, "fund_state_hits": 1, "fund_state_misses": 2}
+
+def test_lookups_of_missing_funds(registry, capsys):
+    METRICS.take()
+    assert registry.get("ZZZ") is None
+    assert registry.restrictions("ZZZ") == MISSING_FUND
+    assert registry.provider("ZZZ", "NSW") is None
+    assert registry.ambulance_details("ZZZ", "NSW") == (MISSING_FUND, MISSING_FUND, MISSING_FUND)
+    _, counts = METRICS.take()
+    assert counts == {"fund_registry_misses": 4}
+    # A missing fund is only reported once.
+    assert capsys.readouterr().out.count("Fund ZZZ is not in the funds file") == 1
+
+@pytest.mark.parametrize("backend", ["soup", "xpath"])
+def test_products_of_missing_funds_are_scraped(bundle, serial_output, scraper, tmp_path, backend):
+    without_aaa = str(tmp_path / "without_aaa")
+    shutil.copytree(bundle, without_aaa)
+    funds_file = os.path.join(without_aaa, FUND_FILE_NAME)
+    tree = etree.parse(funds_file)
+    for fund in tree.getroot():
+        if fund.findtext("FundCode") == "AAA":
+            tree.getroot().remove(fund)
+    tree.write(funds_file)
+
+    outputs = scraper.run(without_aaa, "--backend", backend)
+    assert scraper.output.count("Fund AAA is not in the funds file") == 1
+    assert outputs.keys() == serial_output.keys()
+    for file, rows in outputs.items():
+        expected = serial_output[file]
+        assert len(rows) == len(expected)
+        fund = rows[0].index("Fund")
+        for row, expected_row in zip(rows, expected):
+            if row[fund] != "AAA":
+                assert row == expected_row
+            else:
+                assert row[rows[0].index("Available for")] == MISSING_FUND
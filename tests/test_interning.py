@@ -0,0 +1,42 @@
+'''
+Worker processes must empty their string pool after each batch or shard.
+'''
+
+from argparse import Namespace
+
+import pytest
+
+import xml_parser
+from bundle import open_bundle
+from interning import INTERNER
+from metrics import METRICS
+from parse_funds import load_funds
+from product_filter import ProductFilter
+from stream import get_product_count, iter_product_batches
+
+BATCH_SIZE = 10
+
+
+@pytest.mark.parametrize("backend", ["soup", "xpath"])
+def test_workers_empty_the_pool(bundle, backend):
+    args = Namespace(backend=backend, columns=None, summary=False, filter=ProductFilter(), \
+                     incremental=False, input=bundle)
+    METRICS.take()
+    rows = 0
+    with open_bundle(bundle) as xml_bundle:
+        xml_parser.init_worker(load_funds(False, xml_bundle))
+        for file in xml_bundle.policy_files():
+            with xml_bundle.open(file) as xml_file:
+                product_count = int(get_product_count(xml_file))
+            with xml_bundle.open(file) as xml_file:
+                batches = list(iter_product_batches(xml_file, BATCH_SIZE))
+            assert len(batches) > 1
+            for start, batch in zip(range(0, product_count, BATCH_SIZE), batches):
+                table, worker_metrics = xml_parser.extract_batch_worker(file, batch, args)
+                assert len(INTERNER) == 0 and worker_metrics[1]["interned"] > 0
+                rows += len(table)
+                table, worker_metrics = xml_parser.scrape_shard_worker( \
+                    file, start, batch, product_count, None, args)
+                assert len(INTERNER) == 0 and worker_metrics[1]["interned"] > 0
+                rows -= len(table)
+    assert rows == 0
@@ -0,0 +1,174 @@
+'''
+Every mode of xml_parser.py must write the same files as a serial full run.
+'''
+
+import os, re, sqlite3
+
+import pytest
+
+from synthetic import generate_bundle
+from constants import *
+
+MODES = [
+    ["--stream"],
+    ["--backend", "xpath"],
+    ["--stream", "--backend", "xpath"],
+    ["--workers", "2"],
+    ["--workers", "2", "--shard-size", "7"],
+    ["--workers", "2", "--shard-size", "7", "--backend", "xpath"],
+    ["--pipeline", "--workers", "2"],
+    ["--pipeline", "--workers", "2", "--backend", "xpath"],
+]
+
+# Policy file with repeated products in duplicate_bundle, and the positions
+# of (product repeated, its repeat): one in the same pipeline batch, and one
+# in the next batch (see PIPELINE_BATCH_SIZE).
+DUPLICATE_FILE = "Hospital Synthetic 3.0"
+DUPLICATES = [(4, 6), (1, PIPELINE_BATCH_SIZE + 4)]
+# Premium of the repeats, so their rows differ from those of the first products.
+DUPLICATE_PREM = "999.99"
+
+
+def project(outputs, columns):
+    '''
+    Gets the given columns of the outputs of a full run.
+    '''
+    projected = {}
+    for file, rows in outputs.items():
+        indexes = [rows[0].index(name) for name in columns]
+        projected[file] = [[row[i] for i in indexes] for row in rows]
+    return projected
+
+def select(outputs, keep):
+    '''
+    Gets the rows of the outputs of a full run that keep is true for,
+    as {column name: cell} dicts.
+    '''
+    selected = {}
+    for file, rows in outputs.items():
+        kept = [row for row in rows[1:] if keep(dict(zip(rows[0], row)))]
+        if kept:
+            selected[file] = [rows[0]] + kept
+    return selected
+
+def premiums_by_link(rows):
+    link = rows[0].index("PDFLink")
+    prem = rows[0].index("Monthly Premium")
+    return {row[link]: row[prem] for row in rows[1:]}
+
+@pytest.fixture(scope="module")
+def duplicate_bundle(tmp_path_factory):
+    '''
+    A bundle where DUPLICATE_FILE repeats some of its products with another
+    premium, see DUPLICATES. Returns its directory and {link of a repeated
+    product: premium of its first occurrence}.
+    '''
+    directory = str(tmp_path_factory.mktemp("duplicates"))
+    generate_bundle(directory, int((PIPELINE_BATCH_SIZE + 10) / 0.3), 8)
+    path = os.path.join(directory, DUPLICATE_FILE + ".xml")
+    with open(path, encoding="utf-8") as xml_file:
+        parts = xml_file.read().split("\n<Product ")
+    first_premiums = {}
+    # From the last repeat, so the positions of the earlier ones hold.
+    for original, repeat in sorted(DUPLICATES, key=lambda pair: -pair[1]):
+        product = parts[original + 1].replace("</Products>\n", "")
+        fund = re.search(r"<FundCode>([^<]+)<", product).group(1)
+        code = re.search(r'ProductCode="([^"]+)"', product).group(1)
+        first_premiums[DOWNLOAD_LINK + fund + "/" + code] = \
+            re.search(r"<PremiumNoRebate>([^<]+)<", product).group(1)
+        parts.insert(repeat + 1, re.sub(r"<PremiumNoRebate>[^<]*<", \
+                                        f"<PremiumNoRebate>{DUPLICATE_PREM}<", product))
+    assert len(parts) > PIPELINE_BATCH_SIZE + 1
+    with open(path, "w", encoding="utf-8") as xml_file:
+        xml_file.write("\n<Product ".join(parts))
+    return directory, first_premiums
+
+def non_empty(outputs):
+    '''
+    Gets the outputs with at least one row.
+    '''
+    return {file: rows for file, rows in outputs.items() if len(rows) > 1}
+
+
+def test_serial_output_covers_the_bundle(serial_output):
+    assert len(serial_output) == 4
+    assert all(len(rows) > 10 and rows[0] == COL_NAMES for rows in serial_output.values())
+
+@pytest.mark.parametrize("mode", MODES, ids=" ".join)
+def test_mode_matches_serial_run(bundle, serial_output, scraper, mode):
+    assert scraper.run(bundle, "--no-cache", *mode) == serial_output
+
+@pytest.mark.parametrize("mode", [["--workers", "2", "--shard-size", "7"], \
+                                  ["--pipeline", "--workers", "2"], \
+                                  ["--pipeline", "--workers", "2", "--backend", "xpath"]], \
+                         ids=" ".join)
+def test_repeated_links_keep_one_row(duplicate_bundle, scraper, mode):
+    directory, first_premiums = duplicate_bundle
+    serial = scraper.run(directory, "--no-cache")
+    outputs = scraper.run(directory, "--no-cache", *mode)
+    # One row per link, in the place of the first product. The pipeline
+    # keeps the first row of a link, the other modes the later one.
+    premiums = premiums_by_link(serial[DUPLICATE_FILE])
+    assert {link: premiums[link] for link in first_premiums} == \
+           dict.fromkeys(first_premiums, DUPLICATE_PREM)
+    if "--pipeline" in mode:
+        premiums.update(first_premiums)
+    assert premiums_by_link(outputs[DUPLICATE_FILE]) == premiums
+    assert [row[:6] for row in outputs[DUPLICATE_FILE]] == \
+           [row[:6] for row in serial[DUPLICATE_FILE]]
+    assert outputs.keys() == serial.keys()
+
+def test_incremental_store_reuses_rows(bundle, serial_output, scraper):
+    assert scraper.run(bundle, "--incremental") == serial_output
+    assert "Reused 0 unchanged products" in scraper.output
+    assert scraper.run(bundle, "--incremental", "--stream") == serial_output
+    assert "Reused 0 unchanged products" not in scraper.output
+
+@pytest.mark.parametrize("mode", [[], ["--workers", "2", "--shard-size", "7"]], ids=" ".join)
+def test_resume_matches_serial_run(bundle, serial_output, scraper, mode):
+    scraper.run_interrupted(bundle, "--checkpoint", *mode)
+    # Forgets the end of the file, as if the run had died partway through it.
+    conn = sqlite3.connect(scraper.checkpoint_file())
+    conn.execute("DELETE FROM saved_rows WHERE position >= 10")
+    conn.commit()
+    conn.close()
+    assert scraper.run(bundle, "--resume", *mode) == serial_output
+    assert "Resuming after product 10" in scraper.output
+
+def test_runs_without_checkpoint_save_nothing(bundle, scraper):
+    scraper.run(bundle)
+    assert not os.path.exists(scraper.checkpoint_file())
+
+@pytest.mark.parametrize("mode", [[], ["--workers", "2", "--shard-size", "7"]], ids=" ".join)
+def test_each_product_is_extracted_once(bundle, serial_output, scraper, mode):
+    scraper.run(bundle, "--no-cache", *mode)
+    products = sum(len(rows) - 1 for rows in serial_output.values())
+    stages = scraper.metrics["stages"]
+    assert scraper.metrics["products"] == products
+    assert stages["extract"]["calls"] == stages["load"]["calls"] == products
+
+@pytest.mark.parametrize("backend", ["soup", "xpath"])
+def test_columns_are_a_projection(bundle, serial_output, scraper, backend):
+    columns = ["Name", "Monthly Premium", "Hospital Cover During Visit", "Physio - WP", \
+               "Ambulance - Emergency", "Ambulance - other information"]
+    assert scraper.run(bundle, "--columns", *columns, "--backend", backend) == \
+        project(serial_output, columns)
+    assert scraper.run(bundle, "--summary", "--backend", backend) == \
+        project(serial_output, SUMMARY_COL_NAMES)
+
+@pytest.mark.parametrize("mode", [[], ["--stream"], ["--backend", "xpath"], \
+                                  ["--workers", "2", "--shard-size", "7"]], ids=" ".join)
+def test_filters_keep_the_matching_rows(bundle, serial_output, scraper, mode):
+    outputs = scraper.run(bundle, "--state", "nsw", "vic", "--status", "Open", *mode)
+    assert outputs == select(serial_output, \
+        lambda row: row["State"] in ("NSW", "VIC") and row["Status"] == "Open")
+    # Files of other types are opened for their schema 2.0 products, and
+    # only skipped once those are filtered out.
+    outputs = scraper.run(bundle, "--fund", "AAB", "--policy-type", "General", "Combined", *mode)
+    assert non_empty(outputs) == select(serial_output, \
+        lambda row: row["Fund"] == "AAB" and row["Policy Type"] in ("General", "Combined"))
+    outputs = scraper.run(bundle, "--policy-type", "Hospital", *mode)
+    assert non_empty(outputs) == select(serial_output, lambda row: row["Policy Type"] == "Hospital")
+    assert "Combined Synthetic 2.0" in outputs
+    outputs = scraper.run(bundle, "--policy-type", "General", "--schema", "3.0", *mode)
+    assert list(outputs) == ["General Synthetic 3.0"]
@@ -0,0 +1,95 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from bundle import open_bundle
+from parse_funds import load_funds
+from policy_store import INDEXED_FIELDS, PolicyStore, build_policy_store, parse_premium
+
+FIELD_VALUES = {
+    "fund_name": ["Fund A", "Fund B", "Fund C"],
+    "state": ["NSW", "VIC", "QLD", "ACT"],
+    "status": ["Open", "Closed"],
+    "schema": ["2.0", "3.0"],
+    "pol_type": ["Hospital", "GeneralHealth", "Combined"],
+}
+PREMIUMS = ["", "n/a", None, "0", "99.50", "150", "150.00", "199.99", "200", "350.25"]
+
+
+def random_policies(rng, count):
+    policies = []
+    for _ in range(count):
+        fields = {attr: rng.choice(values) for attr, values in FIELD_VALUES.items()}
+        policies.append(SimpleNamespace(mo_prem=rng.choice(PREMIUMS), **fields))
+    return policies
+
+def random_query(rng):
+    criteria = {}
+    for field, attr in INDEXED_FIELDS.items():
+        choice = rng.random()
+        if choice < 0.3:
+            criteria[field] = rng.choice(FIELD_VALUES[attr] + ["None of them"])
+        elif choice < 0.5:
+            criteria[field] = rng.sample(FIELD_VALUES[attr], 2)
+    for bound in ("min_prem", "max_prem"):
+        if rng.random() < 0.5:
+            criteria[bound] = rng.choice([0, 99.5, 150, 175, 200, 400])
+    return criteria
+
+def linear_scan(policies, min_prem=None, max_prem=None, **criteria):
+    matches = []
+    for policy in policies:
+        premium = parse_premium(policy.mo_prem)
+        if min_prem is not None and (premium is None or premium < min_prem):
+            continue
+        if max_prem is not None and (premium is None or premium > max_prem):
+            continue
+        wanted = {field: [value] if isinstance(value, str) else value \
+                  for field, value in criteria.items()}
+        if all(getattr(policy, INDEXED_FIELDS[field]) in values \
+               for field, values in wanted.items()):
+            matches.append(policy)
+    return matches
+
+
+def test_queries_match_a_linear_scan():
+    rng = random.Random(14)
+    policies = random_policies(rng, 400)
+    store = PolicyStore(policies[:250])
+    for query in range(300):
+        if query == 150:
+            # Policies added after a query are indexed too.
+            for policy in policies[250:]:
+                store.add(policy)
+        criteria = random_query(rng)
+        assert store.query(**criteria) == linear_scan(store.policies, **criteria), criteria
+    assert store.query() == policies
+
+def test_premium_range_bounds_are_included():
+    premiums = ["150", "", "99.50", "200", "150.00", "n/a", "350.25"]
+    store = PolicyStore(SimpleNamespace(mo_prem=premium, **{attr: "x" for attr in FIELD_VALUES}) \
+                        for premium in premiums)
+    assert store.premium_range(150, 200) == {0, 3, 4}
+    assert store.premium_range(max_prem=150) == {0, 2, 4}
+    assert store.premium_range(min_prem=200.01) == {6}
+    assert store.premium_range() == {0, 2, 3, 4, 6}
+    assert store.premium_range(300, 200) == set()
+
+def test_query_rejects_unknown_fields():
+    with pytest.raises(ValueError):
+        PolicyStore().query(adults="2")
+
+def test_stored_policies_drop_their_products(bundle):
+    with open_bundle(bundle) as xml_bundle:
+        funds_dict = load_funds(False, xml_bundle)
+        store = build_policy_store(xml_bundle, funds_dict, stream=True)
+        detailed = build_policy_store(xml_bundle, funds_dict, stream=True, details=True)
+    assert len(store) == len(detailed)
+    for policy, full in zip(store.policies, detailed.policies):
+        assert policy.loaders == {} and policy.hosp_cover is None
+        assert (policy.pol_name, policy.mo_prem, policy.state) == \
+               (full.pol_name, full.mo_prem, full.state)
+        assert full.hosp_cover is not None
+    assert store.query(state="NSW", max_prem=200) == \
+           linear_scan(store.policies, state="NSW", max_prem=200)
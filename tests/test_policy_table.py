@@ -0,0 +1,46 @@
+from policy_table import PolicyTable
+
+COLUMNS = ["Name", "Monthly Premium", "Adults"]
+
+
+def test_cells_that_are_not_numbers_round_trip():
+    rows = [("a", "", None), ("b", "12.50", "2"), ("c", "n/a", "1x"), ("d", "0.10", "1")]
+    table = PolicyTable(COLUMNS)
+    table.add_rows((row[0], row) for row in rows)
+    assert list(table.rows()) == rows
+
+    table.set_row(1, ("b", None, ""))
+    table.set_row(2, ("c", "3.00", "2"))
+    expected = [rows[0], ("b", None, ""), ("c", "3.00", "2"), rows[3]]
+    assert list(table.rows()) == expected
+
+    other = PolicyTable(COLUMNS)
+    other.add_rows([("e", ("e", "", "abc")), ("f", ("f", "7", None))])
+    table.update(other)
+    expected += [("e", "", "abc"), ("f", "7", None)]
+    assert list(table.rows()) == expected
+    assert table.column("Monthly Premium") == [row[1] for row in expected]
+
+def test_later_rows_replace_earlier_ones_in_place():
+    table = PolicyTable(COLUMNS)
+    table.add_rows([("a", ("a", "1.00", "1")), ("b", ("b", "2.00", "2")), ("a", ("a2", "", "2"))])
+    table.add_rows([("b", ("b2", "n/a", "1"))])
+    assert table.links() == ["a", "b"]
+    assert list(table.rows()) == [("a2", "", "2"), ("b2", "n/a", "1")]
+
+def test_update_with_shared_links_keeps_order():
+    table = PolicyTable(COLUMNS)
+    table.add_rows([("a", ("a", "1.00", "1")), ("b", ("b", "2.00", "2"))])
+    other = PolicyTable(COLUMNS)
+    other.add_rows([("c", ("c", "3.00", "1")), ("a", ("a2", "4.00", "2"))])
+    table.update(other)
+    assert table.links() == ["a", "b", "c"]
+    assert list(table.rows()) == [("a2", "4.00", "2"), ("b", "2.00", "2"), ("c", "3.00", "1")]
+
+def test_without_numbers_and_value_counts():
+    table = PolicyTable(COLUMNS)
+    table.add_rows([("a", ("x", "1.50", "1")), ("b", ("y", "", "2")), ("c", ("x", "2.25", "2"))])
+    assert list(table.without({"b"}).rows()) == [("x", "1.50", "1"), ("x", "2.25", "2")]
+    numbers = table.numbers("Monthly Premium")
+    assert numbers[0] == 1.5 and numbers[2] == 2.25 and numbers[1] != numbers[1]
+    assert table.value_counts("Name") == {"x": 2, "y": 1}
@@ -0,0 +1,64 @@
+'''
+ProductFilter must give the same answer on lxml elements and on soup products.
+'''
+
+from bs4 import BeautifulSoup
+import pytest
+
+from bundle import open_bundle
+from product_filter import ProductFilter
+from stream import iter_product_elements
+
+FILTERS = [
+    {"funds": ["aab", "AAC"]},
+    {"states": ["NSW"], "statuses": ["open"]},
+    {"schemas": ["2.0"]},
+    {"funds": ["AAA"], "states": ["VIC", "QLD"], "schemas": ["3.0"]},
+    {"pol_types": ["Hospital"]},
+    {"pol_types": ["combined", "General"], "states": ["NSW", "ACT"]},
+]
+
+
+def bundle_products(bundle):
+    '''
+    Yields (file, soup product, lxml element) for the products of the bundle.
+    '''
+    with open_bundle(bundle) as xml_bundle:
+        for file in xml_bundle.policy_files():
+            with xml_bundle.open(file) as xml_file:
+                soups = BeautifulSoup(xml_file, "lxml").find_all("product")
+            elements = iter_product_elements(xml_bundle.open(file))
+            for soup, elem in zip(soups, elements):
+                yield file, soup, elem
+
+
+@pytest.mark.parametrize("spec", FILTERS, ids=str)
+def test_elements_and_soups_match_alike(bundle, spec):
+    product_filter = ProductFilter(**spec)
+    kept = 0
+    for file, soup, elem in bundle_products(bundle):
+        file_filter = product_filter.for_file(file)
+        matches = file_filter.matches_element(elem)
+        assert matches == file_filter.matches_soup(soup)
+        kept += matches
+    assert kept > 0
+
+def test_schema_2_products_match_their_product_type(bundle):
+    product_filter = ProductFilter(pol_types=["Hospital"])
+    kept = {}
+    for file, soup, _ in bundle_products(bundle):
+        if product_filter.for_file(file).matches_soup(soup):
+            kept.setdefault(file, []).append(soup.find("producttype"))
+    # Only the Hospital products of the schema 2.0 file, of their ProductType.
+    assert sorted(kept) == ["Combined Synthetic 2.0.xml", "Hospital Synthetic 3.0.xml"]
+    assert {tag.get_text() for tag in kept["Combined Synthetic 2.0.xml"]} == {"Hospital"}
+
+def test_policy_types_select_files():
+    product_filter = ProductFilter(pol_types=["general"], schemas=["3.0"])
+    assert product_filter
+    assert product_filter.matches_file("General Synthetic 3.0.xml")
+    assert not product_filter.matches_file("Combined Synthetic 3.0.xml")
+    # Schema 2.0 products can be of any type, whatever their file.
+    assert ProductFilter(pol_types=["general"]).matches_file("Combined Synthetic 2.0.xml")
+    assert not ProductFilter()
+    assert ProductFilter().matches_file("Combined Synthetic 3.0.xml")
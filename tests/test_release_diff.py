@@ -0,0 +1,103 @@
+import os, re, sys, shutil
+
+import pytest
+
+from bundle import open_bundle
+from release_diff import diff_releases, field_delta, parse_excess
+
+EDITED_FILE = "Hospital Synthetic 3.0.xml"
+
+
+class ListSink():
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+
+def product_lines(path):
+    with open(path, encoding="utf-8") as xml_file:
+        return xml_file.read().split("\n<Product ")
+
+def write_product_lines(path, parts):
+    with open(path, "w", encoding="utf-8") as xml_file:
+        xml_file.write("\n<Product ".join(parts))
+
+def product_code(part):
+    return re.match(r'ProductCode="([^"]+)"', part).group(1)
+
+def diff(old, new, **options):
+    sink = ListSink()
+    with open_bundle(old) as old_bundle, open_bundle(new) as new_bundle:
+        counts = diff_releases(old_bundle, new_bundle, sink, **options)
+    return counts, sink.rows
+
+@pytest.fixture(autouse=True)
+def fund_cache(monkeypatch, tmp_path):
+    '''
+    diff_releases caches the funds under sys.path[0] (see parse_funds.fund_cache_file),
+    so the cache of the tests is kept out of the repo.
+    '''
+    monkeypatch.setattr(sys, "path", [str(tmp_path)] + sys.path[1:])
+
+@pytest.fixture(scope="module")
+def new_release(bundle, tmp_path_factory):
+    '''
+    A copy of the bundle where, in EDITED_FILE, the first product has a new
+    premium, the second product is removed and the third has a new code.
+    Returns the directory and the codes of those three products.
+    '''
+    directory = str(tmp_path_factory.mktemp("new_release"))
+    for name in os.listdir(bundle):
+        shutil.copy(os.path.join(bundle, name), directory)
+    path = os.path.join(directory, EDITED_FILE)
+    parts = product_lines(path)
+    codes = [product_code(part) for part in parts[1:4]]
+    assert len(set(product_code(part) for part in parts[1:])) == len(parts) - 1
+    parts[1] = re.sub(r"<PremiumNoRebate>[^<]*<", "<PremiumNoRebate>123.45<", parts[1])
+    parts[3] = parts[3].replace(f'ProductCode="{codes[2]}"', 'ProductCode="99999999X"')
+    del parts[2]
+    write_product_lines(path, parts)
+    return directory, codes
+
+
+def test_parse_excess():
+    excess = "ExcessPerAdmission is $250\nExcessPerPolicy is $500.50\n" \
+             "ExcessWaivers for Children under 18.\nOther is $n/a\n"
+    assert parse_excess(excess) == {"ExcessPerAdmission": 250.0, "ExcessPerPolicy": 500.5}
+    assert parse_excess("No excess.") == {}
+
+def test_field_delta():
+    assert field_delta("mo_prem", "100", "110.50") == "+10.50 (+10.5%)"
+    assert field_delta("mo_prem", "0", "20") == "+20.00"
+    assert field_delta("mo_prem", "", "20") == ""
+    old = "ExcessPerAdmission is $250\nExcessPerPolicy is $500\n"
+    new = "ExcessPerAdmission is $300\nExcessPerYear is $100\n"
+    assert field_delta("excess", old, new) == \
+           "ExcessPerAdmission +50.00; + ExcessPerYear 100.00; - ExcessPerPolicy 500.00"
+    assert field_delta("hosp_covered", ("A", "B"), ("B", "C")) == "+ C; - A"
+    assert field_delta("status", "Open", "Closed") == ""
+
+def test_release_against_itself_is_unchanged(bundle):
+    counts, rows = diff(bundle, bundle, stream=True)
+    assert rows == []
+    assert counts["added"] == counts["removed"] == counts["changed"] == 0
+    assert counts["unchanged"] > 0
+
+@pytest.mark.parametrize("backend", ["soup", "xpath"])
+def test_diff_finds_the_edits(bundle, new_release, backend):
+    directory, (changed_code, removed_code, renamed_code) = new_release
+    unchanged = diff(bundle, bundle, stream=True)[0]["unchanged"]
+    counts, rows = diff(bundle, directory, backend=backend, stream=True)
+    assert counts == {"added": 1, "removed": 2, "changed": 1, "unchanged": unchanged - 3}
+
+    by_kind = {}
+    for row in rows:
+        by_kind.setdefault(row[0], []).append(row)
+    assert [row[1].endswith("99999999X") for row in by_kind["added"]] == [True]
+    assert sorted(row[1].split("/")[-1] for row in by_kind["removed"]) == \
+           sorted([removed_code, renamed_code])
+    (premium_row,) = by_kind["changed"]
+    assert premium_row[1].split("/")[-1] == changed_code and premium_row[5] == "mo_prem"
+    assert premium_row[7] == "123.45"
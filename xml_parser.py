@@ -12,7 +12,15 @@
 # scrapes. It assumes that the .xml files it needs to scrape can be found in
 # the ./privatehealth-04-apr-2019 directory, relative to the current directory.
 # The excel files that are then populated are stored in the ./results directory, 
-# also relative to cur directory.
+# also relative to cur directory. Run with --help for the other options.
+#
+# See also:
+#  - bundle.py: the --input directory, zip archive or compressed XML file,
+#  - stream.py: --stream, xpath_extract.py: --backend xpath,
+#  - sinks.py: --format, policy_table.py: the rows waiting to be written,
+#  - checkpoint.py: --checkpoint and --resume, incremental.py: --incremental,
+#  - product_filter.py: --fund, --state, --status, --schema and --policy-type,
+#  - metrics.py: --metrics, memo.py and interning.py: shared extraction work.
 #
 # This program also depend on the parse_funds.py file, which parses the funds.xml
 # file. This program requires the information from that program in order to provide
@@ -22,15 +30,28 @@
 # https://data.gov.au/dataset/ds-dga-8ab10b1f-6eac-423c-abc5-bbffc31b216c/details?q=%20private
 '''
 
-from bs4 import BeautifulSoup
-import sys, os, datetime
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import Font
+from bs4 import BeautifulSoup, Tag, NavigableString
+import sys, queue, datetime, argparse, threading
+from operator import attrgetter
+from concurrent.futures import ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 
+from bundle import open_bundle, get_pol_type
+from checkpoint import checkpoint_context, open_checkpoint
 from hosp import HospService
-from policy import NewPolicy, OldPolicy
+from policy import LazyNewPolicy, LazyOldPolicy, NOT_LOADED
 from general import GeneralService
-from parse_funds import parse_funds_file, Fund
+from parse_funds import load_funds
+from incremental import open_product_store
+from interning import INTERNER
+from memo import HOSP_MEMO, GENERAL_MEMO
+from metrics import METRICS, Progress
+from product_filter import ProductFilter
+from product_index import ProductIndex
+from policy_table import PolicyTable, TABLE_BATCH_SIZE
+from sinks import SINKS, open_sink
+from stream import get_product_count, iter_products, iter_product_batches, \
+    soup_from_xml, element_from_xml
+import xpath_extract
 from constants import *
 
 
@@ -62,19 +83,6 @@ def get_excess(soup):
         return "No excess."
     return excess_str
 
-def get_pol_type(file_name):
-    '''
-    Gets the type for the policy.
-    '''
-    if 'Hospital' in file_name:
-        return 'Hospital'
-    elif 'General' in file_name:
-        return 'General'
-    elif 'Combined' in file_name:
-        return 'Combined'
-    else:
-        return "Can't find policy type."
-
 def find_all_soup(soup, tag):
     '''
     Gets the text from an xml tag.
@@ -103,6 +111,7 @@ def get_wait(product):
         
     return wait_str
 
+@METRICS.timed("get_hosp_details")
 def get_hosp_details(product, schema):
     '''
     Get all the hospital details required.
@@ -158,6 +167,7 @@ def get_benefits(service):
 
     return ben_str
 
+@METRICS.timed("get_general_services")
 def get_general_services(product, schema):
     '''
     Gets all information about the general services.
@@ -186,6 +196,7 @@ def get_general_services(product, schema):
 
     return general_details
 
+@METRICS.timed("get_benefit_limits")
 def get_benefit_limits(product, general_details):
     '''
     Gets all the limits of general services.
@@ -209,7 +220,8 @@ def get_benefit_limits(product, general_details):
             if s['sublimitsapply'] == "true":
                 general_details[service].limits += " sublimits apply"
 
-def get_prov_arr(product, state, fund_obj, schema):
+@METRICS.timed("get_prov_arr")
+def get_prov_arr(product, fund_code, state, funds_dict, schema):
     '''
     Gets the provider arrangements for a policy.
     '''
@@ -224,13 +236,11 @@ def get_prov_arr(product, state, fund_obj, schema):
         if usefund == "false":
             return provider_element.get_text().strip()
         
-        # True: provider can be found in the fund dictionary.
-        provider_services = fund_obj.preferred_provider_services
-        for provider in provider_services:
-            if provider[0] == state:
-                return provider[1]
-
-        return "No provider arrangements found."
+        # True: provider can be found in the fund registry.
+        provider = funds_dict.provider(fund_code, state)
+        if provider is None:
+            return "No provider arrangements found."
+        return provider
     elif schema == '2.0':
         provider_elements = product.find_all('preferredproviderservices')
         if not provider_elements:
@@ -239,20 +249,20 @@ def get_prov_arr(product, state, fund_obj, schema):
 
     return "Wrong schema."
 
-def get_amb_info_new(product, fund_code, funds_dict):
+def get_amb_info_new(product, fund_code, state, funds_dict):
     '''
-    Gets ambulance information for schema 3 policies.
+    Gets ambulance information for schema 3 policies, as
+    (amb_emer, amb_callout_fees, amb_other).
     '''
     product_ambulance = product.find_all('productambulance')
     if not product_ambulance:
-        return "No ambulance information found."
+        return ("No ambulance information found.",) * 3
     
     usefund = product_ambulance[0]['usefund']
     if usefund == "false":
-        return product_ambulance[0].get_text().strip()
+        return (product_ambulance[0].get_text().strip(),) * 3
 
-    fund_obj = funds_dict[fund_code]
-    return fund_obj
+    return funds_dict.ambulance_details(fund_code, state)
 
 def get_amb_info_old(product, general_dict):
     '''
@@ -263,7 +273,6 @@ def get_amb_info_old(product, general_dict):
     try:
         ambulance = product.find_all('generalhealthambulance')[0]
     except:
-        print(type(general_dict))
         general_dict['Ambulance'].limits = "Cant find ambulance info."
         return
     cover = ambulance['cover']
@@ -281,22 +290,50 @@ def get_amb_info_old(product, general_dict):
         general_dict['Ambulance'].limits = benefit_limit
         general_dict['Ambulance'].wait   = wait_str
 
-def get_amb_other(other_list, state):
+# Tags read by get_hosp_details, and by get_general_services (with
+# get_amb_info_old for schema 2.0), containers first. Their markup keys the memos.
+HOSP_TAGS = ["hospitalcover", "medicalservice", "waitingperiods", "otherproductfeatures", "copayments"]
+GENERAL_TAGS = ["generalhealthservices", "generalhealthservice", "benefitlimits", "benefitlimit"]
+OLD_GENERAL_TAGS = GENERAL_TAGS + ["generalhealthambulance"]
+
+def add_tag_parts(tag, parts):
     '''
-    Get other ambulance features from the list of possibilities.
-    Each state has different ambulance features. 
-    Can be found in the fund xml file.
+    Adds the names, attributes and strings of a tag and its children to
+    parts, with a "/" closing each tag. This tells subtrees apart like
+    str(tag) does, at a fraction of its cost.
     '''
-    amb_other = "Not found."
-    for other in other_list:
-        if state == other[0]:
-            return other[1]
-    return amb_other
+    parts.append(tag.name)
+    parts.append(repr(tag.attrs))
+    for child in tag.contents:
+        if isinstance(child, Tag):
+            add_tag_parts(child, parts)
+        else:
+            if type(child) is not NavigableString:
+                parts.append(type(child).__name__)
+            parts.append(str(child))
+    parts.append("/")
+
+def subtree_parts(product, schema, tags):
+    '''
+    Gets the schema and the parts of every tag with one of the names that
+    is not inside another one, i.e. of all the XML an extractor reads.
+    '''
+    parts = [schema]
+    taken = set()
+    for name in tags:
+        for tag in product.find_all(name):
+            if any(id(parent) in taken for parent in tag.parents):
+                continue
+            taken.add(id(tag))
+            add_tag_parts(tag, parts)
+    return parts
 
 def schema_3(product, xml_file, funds_dict, schema, pdf_link):
     '''
     Gets all the required information from new policies, 
     i.e. schema 3.0 policies.
+    The hospital cover, general services, provider arrangements and
+    ambulance details are only extracted when the policy's fields are read.
     '''
     pol_name   = find_all_soup(product, "name")
     fund_name  = find_all_soup(product, "fundcode")
@@ -311,24 +348,33 @@ def schema_3(product, xml_file, funds_dict, schema, pdf_link):
     dpndnts    = find_all_soup(product, 'scale')
     # CHANGE THIS
     pol_type   = get_pol_type(xml_file)
-    hosp_det   = get_hosp_details(product, schema)
-    general    = get_general_services(product, schema)
     medicare   = find_all_soup(product, 'medicarelevysurchargeexempt')
     issue_date = find_all_soup(product, 'dateissued')
-    prov_arr   = get_prov_arr(product, state, funds_dict[fund_name], schema)
     other      = find_all_soup(product, 'otherservices')
-    avail_for  = funds_dict[fund_name].restrictions
-    amb = get_amb_info_new(product, fund_name, funds_dict)
-    if isinstance(amb, Fund):
-        amb_emer = amb.amb_emer
-        callout_fee = amb.amb_call_out_fees
-        amb_other = get_amb_other(amb.amb_other, state)
-    else:
-        amb_emer = callout_fee = amb_other = amb
+    avail_for  = funds_dict.restrictions(fund_name)
+
+    def load_ambulance():
+        amb_emer, amb_callout_fees, amb_other = get_amb_info_new(product, fund_name, state, funds_dict)
+        return {"amb_emer": amb_emer, "amb_callout_fees": amb_callout_fees, "amb_other": amb_other}
+
+    def load_hosp():
+        parts = subtree_parts(product, schema, HOSP_TAGS)
+        return {"hosp_cover": HOSP_MEMO.get(parts, lambda: get_hosp_details(product, schema))}
+
+    def load_general():
+        parts = subtree_parts(product, schema, GENERAL_TAGS)
+        return {"gen_services": GENERAL_MEMO.get(parts, lambda: get_general_services(product, schema))}
+
+    loaders = {
+        "hosp_cover": load_hosp,
+        "gen_services": load_general,
+        "prov_arr": lambda: {"prov_arr": get_prov_arr(product, fund_name, state, funds_dict, schema)},
+        "ambulance": load_ambulance,
+    }
     try:
         corp = product.find_all('corporate')[0]['atomic']
     except:
-        "No corporate information found."
+        corp = "No corporate information found."
     try:
         age_disc = product.find_all('agebaseddiscount')[0]['available']
     except:
@@ -343,10 +389,10 @@ def schema_3(product, xml_file, funds_dict, schema, pdf_link):
         trav_accom_ben = "No travel and accommodation benefits."
 
 
-    new_pol = NewPolicy(schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, state, adults, \
-        dpndnts, "None avail", pol_type, corp, medicare, issue_date, avail_for, \
-        prov_arr, hosp_det, general, other, age_disc, trav_accom_ben, pol_id, accident_cov, amb_emer, \
-        callout_fee, amb_other)
+    new_pol = LazyNewPolicy(loaders, schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, \
+        state, adults, dpndnts, "None avail", pol_type, corp, medicare, issue_date, avail_for, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED, other, age_disc, trav_accom_ben, pol_id, accident_cov, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED)
 
     return new_pol
 
@@ -354,6 +400,8 @@ def schema_2(product, xml_file_name, funds_dict, schema, pdf_link):
     '''
     Gets all the information required for old policies, 
     i.e. schema 2.0 policies.
+    The hospital cover, general services and provider arrangements are
+    only extracted when the policy's fields are read.
     '''
     pol_name   = find_all_soup(product, "name")
     fund_name  = find_all_soup(product, "fundcode")
@@ -368,220 +416,845 @@ def schema_2(product, xml_file_name, funds_dict, schema, pdf_link):
     dpndnts    = find_all_soup(product, 'category')
     pol_type   = find_all_soup(product, 'producttype')
     corp       = product.find_all('corporate')[0]['atomic'] 
-    hosp_det   = get_hosp_details(product, schema)
     medicare   = find_all_soup(product, 'medicarelevysurchargeexempt')
     issue_date = find_all_soup(product, 'dateissued')
-    prov_arr   = get_prov_arr(product, state, funds_dict[fund_name], schema)
     other      = find_all_soup(product, 'otherservices')
-    avail_for  = funds_dict[fund_name].restrictions
-    if pol_type != 'Hospital':
+    avail_for  = funds_dict.restrictions(fund_name)
+
+    def load_hosp():
+        parts = subtree_parts(product, schema, HOSP_TAGS)
+        return {"hosp_cover": HOSP_MEMO.get(parts, lambda: get_hosp_details(product, schema))}
+
+    def build_general():
         general = get_general_services(product, schema)
         get_amb_info_old(product, general)
-    else:
-        general = ""
+        return general
+
+    def load_general():
+        if pol_type == 'Hospital':
+            return {"gen_services": ""}
+        parts = subtree_parts(product, schema, OLD_GENERAL_TAGS)
+        return {"gen_services": GENERAL_MEMO.get(parts, build_general)}
 
-    old_pol = OldPolicy(schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, state, adults, \
-        dpndnts, "No avail", pol_type, corp, medicare, issue_date, avail_for, prov_arr, hosp_det, \
-        general, other)
+    loaders = {
+        "hosp_cover": load_hosp,
+        "gen_services": load_general,
+        "prov_arr": lambda: {"prov_arr": get_prov_arr(product, fund_name, state, funds_dict, schema)},
+    }
+
+    old_pol = LazyOldPolicy(loaders, schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, \
+        state, adults, dpndnts, "No avail", pol_type, corp, medicare, issue_date, avail_for, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED, other)
 
     return old_pol
 
-def create_excel(destination):
-    '''
-    Sets up Excel Category Sheet & Bold title given sheetname
-    '''
-    wb = Workbook()
-    ws = wb.active
-    colname = ["PDF Type", "Name", "Fund", "PDFLink", "Status", "Excess", \
-            "Monthly Premium", "State", "Adults", "Scale (Adults + Dependants)", \
-            "Availability", "Policy Type", "Corporate Product", \
-            "Hospital Cover During Visit", "Hospital Services not Covered", \
-            "Hospital Services Limited Cover", "Waiting periods", "Copayment", \
-            "Other Hospital Cover Features", "General Dental - WP", \
-            "General Dental - Limits", "General Dental - Max Benefits", \
-            "Major Dental - WP", "Major Dental - Limits", "Major Dental - Max Benefits", \
-            "Endodontic - WP", "Endodontic - Limits", "Endodontic - Max Benefits", \
-            "Orthodontic - WP", "Orthodontic - Limits", "Orthodontic - Max Benefits", \
-            "Optical - WP", "Optical - Limits", "Optical - Max Benefits", \
-            "NonPBSPharmaceuticals - WP", "NonPBSPharmaceuticals - Limits", \
-            "NonPBSPharmaceuticals - Max Benefits", "Physio - WP", "Physio - Limits", \
-            "Physio - Max Benefits", "Chiropractic - WP", "Chiropractic - Limits", \
-            "Chiropractic - Max Benefits", "Podiatry - WP", "Podiatry - Limits", \
-            "Podiatry - Max Benefits", "Psychology - WP", "Psychology - Limits", \
-            "Psychology - Max Benefits", "Acupuncture - WP", "Acupuncture - Limits", \
-            "Acupuncture - Max Benefits", "Naturopathy - WP", "Naturopathy - Limits", \
-            "Naturopathy - Max Benefits", "Massage - WP", "Massage - Limits", \
-            "Massage - Max Benefits", "HearingAids - WP", "HearingAids - Limits", \
-            "HearingAids - Max Benefits", "BloodGlucose Monitoring - WP", \
-            "BloodGlucose Monitoring - Limits", "BloodGlucose Monitoring - Max Benefits", \
-            "Ambulance - Emergency", "Ambulance - Call out fees", "Ambulance - other information", \
-            "Other Treatment Cover Features", "Medicare Surcharge Levy", "Issue Date", \
-            "Available for", "Provider Arrangements", "Youth discount", \
-            "Travel and accommodation beneft", "Policy ID", "Accident cover"]
-    #Creates Bold Column Titles
-    for i in range(len(colname)):
-        ws.cell(row = 1, column = i + 1).value = colname[i]
-        ws.cell(row = 1, column = i + 1).font = Font(size = 14, bold = True)
-    wb.save(filename=destination)
-
-def write_policy(excel, policy, input_row, ws):
-    '''
-    Writes all the policy information to the excel sheet passed in as ws.
+# (column, policy attribute) of the fields that go into the row as they are.
+POLICY_FIELDS = [
+    (COL_POL_NAME, "pol_name"), (COL_FUND_NAME, "fund_name"), (COL_PDF_LINK, "pdf_link"),
+    (COL_STATUS, "status"), (COL_EXCESS, "excess"), (COL_MOPREM, "mo_prem"),
+    (COL_STATE, "state"), (COL_ADULTS, "adults"), (COL_DPNDNTS, "dpndnts"),
+    (COL_AVAIL, "avail"), (COL_POL_TYPE, "pol_type"), (COL_CORP, "corp"),
+    (COL_ISSUE_DATE, "issue_date"), (COL_AVAIL_FOR, "avail_for"), (COL_OTHER, "other"),
+]
+# The same, for the fields only schema 3.0 policies have.
+NEW_POLICY_FIELDS = [
+    (COL_AGE_DISC, "youth_disc"), (COL_TRAV_ACCOM_BEN, "travel_accom_ben"),
+    (COL_POL_ID, "pol_id"), (COL_ACCIDENT_COV, "accident_cover"),
+]
+# The same, for the lazy fields, by the group of their loader. Ambulance
+# fields are only loaded for schema 3.0 policies.
+LAZY_FIELDS = {
+    "prov_arr": [(COL_PROV_ARR, "prov_arr")],
+    "ambulance": [(COL_AMBULANCE_EMER, "amb_emer"), (COL_AMBULANCE_FEE, "amb_callout_fees"), \
+                  (COL_AMBULANCE_OTHER, "amb_other")],
+}
+POLICY_COLS = [col - 1 for col, _ in POLICY_FIELDS]
+get_policy_fields = attrgetter(*[attr for _, attr in POLICY_FIELDS])
+NEW_POLICY_COLS = [col - 1 for col, _ in NEW_POLICY_FIELDS]
+get_new_policy_fields = attrgetter(*[attr for _, attr in NEW_POLICY_FIELDS])
+AMBULANCE_COLS = [col - 1 for col, _ in LAZY_FIELDS["ambulance"]]
+ALL_GROUPS = {"hosp_cover", "gen_services", "prov_arr", "ambulance"}
+OLD_PDF = "OLD PDF. Does not contain this."
+
+# (service title, schema): index of the service's first column, or None.
+service_cols = {}
+
+def get_service_col(title, schema):
+    '''
+    Gets the index of the first of the three columns (wait, limits and
+    max benefits) of a general service, or None if it has no columns.
+    The title is matched against GENERAL_SERVICE_COLS once, after
+    that the column is looked up.
+    '''
+    key = (title, schema)
+    if key not in service_cols:
+        col = None
+        for part, service_col in GENERAL_SERVICE_COLS:
+            if part in title:
+                col = service_col - 1
+                break
+        if col is None and 'Ambulance' in title and schema == '2.0':
+            col = COL_AMBULANCE_WP - 1
+        service_cols[key] = col
+    return service_cols[key]
+
+def join_cover(services):
     '''
+    Joins hospital services into a single cell, each followed by ", ".
+    '''
+    return "".join([f"{s}, " for s in services])
+
+def policy_row(policy, groups=None):
+    '''
+    Builds the excel row for a policy, as a list of cell values.
+    With groups, only the lazy fields of those groups (see column_group)
+    are read, and the columns of the other groups are left empty.
+    '''
+    if groups is None:
+        groups = ALL_GROUPS
+    row = [None] * len(COL_NAMES)
     # Input basic policy information.
-    ws.cell(row=input_row, column=COL_POL_NAME).value = policy.pol_name
-    ws.cell(row=input_row, column=COL_FUND_NAME).value = policy.fund_name
-    ws.cell(row=input_row, column=COL_PDF_LINK).value = policy.pdf_link
-    ws.cell(row=input_row, column=COL_STATUS).value = policy.status
-    ws.cell(row=input_row, column=COL_EXCESS).value = policy.excess
-    ws.cell(row=input_row, column=COL_MOPREM).value = policy.mo_prem
-    ws.cell(row=input_row, column=COL_STATE).value = policy.state
-    ws.cell(row=input_row, column=COL_ADULTS).value = policy.adults
-    ws.cell(row=input_row, column=COL_DPNDNTS).value = policy.dpndnts
-    ws.cell(row=input_row, column=COL_AVAIL).value = policy.avail
-    ws.cell(row=input_row, column=COL_POL_TYPE).value = policy.pol_type
-    ws.cell(row=input_row, column=COL_CORP).value = policy.corp
-    ws.cell(row=input_row, column=COL_ISSUE_DATE).value = policy.issue_date
-    ws.cell(row=input_row, column=COL_AVAIL_FOR).value = policy.avail_for
-    ws.cell(row=input_row, column=COL_PROV_ARR).value = policy.prov_arr
-    ws.cell(row=input_row, column=COL_OTHER).value = policy.other
-    medicare = policy.medicare
-    if medicare == "true":
-        ws.cell(row=input_row, column=COL_MEDICARE).value = "Exempted"
+    for col, value in zip(POLICY_COLS, get_policy_fields(policy)):
+        row[col] = value
+    if "prov_arr" in groups:
+        row[COL_PROV_ARR - 1] = policy.prov_arr
+    if policy.medicare == "true":
+        row[COL_MEDICARE - 1] = "Exempted"
     else:
-        ws.cell(row=input_row, column=COL_MEDICARE).value = "Not exempted"
+        row[COL_MEDICARE - 1] = "Not exempted"
     if policy.schema == '2.0':
-        ws.cell(row=input_row, column=COL_PDF_TYPE).value = "OLD"
-        ws.cell(row=input_row, column=COL_AGE_DISC).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_TRAV_ACCOM_BEN).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_POL_ID).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_ACCIDENT_COV).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_AMBULANCE_EMER).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_AMBULANCE_FEE).value = "OLD PDF. Does not contain this."
-        ws.cell(row=input_row, column=COL_AMBULANCE_OTHER).value = "OLD PDF. Does not contain this."
+        row[COL_PDF_TYPE - 1] = "OLD"
+        for col in NEW_POLICY_COLS + AMBULANCE_COLS:
+            row[col] = OLD_PDF
     else:
-        ws.cell(row=input_row, column=COL_PDF_TYPE).value = "NEW"
-        ws.cell(row=input_row, column=COL_AGE_DISC).value = policy.youth_disc
-        ws.cell(row=input_row, column=COL_TRAV_ACCOM_BEN).value = policy.travel_accom_ben
-        ws.cell(row=input_row, column=COL_POL_ID).value = policy.pol_id
-        ws.cell(row=input_row, column=COL_ACCIDENT_COV).value = policy.accident_cover
-        ws.cell(row=input_row, column=COL_AMBULANCE_EMER).value = policy.amb_emer
-        ws.cell(row=input_row, column=COL_AMBULANCE_FEE).value = policy.amb_callout_fees
-        ws.cell(row=input_row, column=COL_AMBULANCE_OTHER).value = policy.amb_other
+        row[COL_PDF_TYPE - 1] = "NEW"
+        for col, value in zip(NEW_POLICY_COLS, get_new_policy_fields(policy)):
+            row[col] = value
+        if "ambulance" in groups:
+            for col, attr in LAZY_FIELDS["ambulance"]:
+                row[col - 1] = getattr(policy, attr)
 
-    
     # Inputting hospital cover details.
-    covered = ""
-    for c in policy.hosp_cover.covered:
-        covered += f"{c}, "
-    ws.cell(row=input_row, column=COL_HOSP_COVERED).value = covered
-    not_covered = ""
-    for c in policy.hosp_cover.not_covered:
-        not_covered += f"{c}, "
-    limited_cover = ""
-    ws.cell(row=input_row, column=COL_HOSP_NOT_COVERED).value = not_covered
-    for c in policy.hosp_cover.limited_cover:
-        limited_cover += f"{c}, "
-    ws.cell(row=input_row, column=COL_HOSP_LIMITED).value = limited_cover
-    ws.cell(row=input_row, column=COL_WAIT_PERIODS).value = policy.hosp_cover.wait
-    ws.cell(row=input_row, column=COL_COPAYMENT).value = policy.hosp_cover.co_pay
-    ws.cell(row=input_row, column=COL_OTHER_HOSP).value = policy.hosp_cover.other
+    if "hosp_cover" in groups:
+        hosp_cover = policy.hosp_cover
+        row[COL_HOSP_COVERED - 1] = join_cover(hosp_cover.covered)
+        row[COL_HOSP_NOT_COVERED - 1] = join_cover(hosp_cover.not_covered)
+        row[COL_HOSP_LIMITED - 1] = join_cover(hosp_cover.limited_cover)
+        row[COL_WAIT_PERIODS - 1] = hosp_cover.wait
+        row[COL_COPAYMENT - 1] = hosp_cover.co_pay
+        row[COL_OTHER_HOSP - 1] = hosp_cover.other
 
     # Inputting general details.
-    for s in policy.gen_services:
-        col = ''
-        if 'DentalGeneral' in s:
-            col = COL_GENERAL_DENTAL
-        elif 'DentalMajor' in s:
-            col = COL_MAJOR_DENTAL
-        elif 'Endodontic' in s:
-            col = COL_ENDODONTIC
-        elif 'Orthodontic' in s:
-            col = COL_ORTHODONTIC
-        elif 'Optical' in s:
-            col = COL_OPTICAL
-        elif 'NonPBS' in s:
-            col = COL_NONPSBPHARM
-        elif 'Physio' in s:
-            col = COL_PHYSIO
-        elif 'Chiro' in s:
-            col = COL_CHIRO
-        elif 'Podiatry' in s:
-            col = COL_PODIATRY
-        elif 'Psychology' in s:
-            col = COL_PSYCH
-        elif 'Acupuncture' in s:
-            col = COL_ACUPUNC
-        elif 'Naturopathy' in s:
-            col = COL_NATUR
-        elif 'Massage' in s:
-            col = COL_MASSAGE
-        elif 'HearingAids' in s:
-            col = COL_HEARING
-        elif 'Glucose' in s:
-            col = COL_BLOOD
-        elif 'Ambulance' in s and policy.schema == '2.0':
-            col = COL_AMBULANCE_WP
-        
-        if col != '':
-            ws.cell(row=input_row, column=col).value = policy.gen_services[s].wait 
-            ws.cell(row=input_row, column=col+1).value = policy.gen_services[s].limits 
-            ws.cell(row=input_row, column=col+2).value = policy.gen_services[s].max_ben 
+    if "gen_services" in groups:
+        gen_services = policy.gen_services
+        for s in gen_services:
+            col = get_service_col(s, policy.schema)
+            if col is not None:
+                service = gen_services[s]
+                row[col:col + 3] = service.wait, service.limits, service.max_ben
+
+    return row
+
+def column_group(col, schema):
+    '''
+    Gets the group of the lazy fields a column (counting from 1) is filled
+    from, for a policy of the given schema, or None if it is filled from
+    the fields read when the policy is scraped.
+    '''
+    if COL_HOSP_COVERED <= col <= COL_OTHER_HOSP:
+        return "hosp_cover"
+    if COL_GENERAL_DENTAL <= col < COL_AMBULANCE_EMER:
+        return "gen_services"
+    if COL_AMBULANCE_EMER <= col <= COL_AMBULANCE_OTHER:
+        # Schema 2.0 has Ambulance as one of its general services.
+        return "gen_services" if schema == '2.0' else "ambulance"
+    if col == COL_PROV_ARR:
+        return "prov_arr"
+    return None
+
+
+class RowPlan():
+    '''
+    The plan of the output columns asked for: the indexes of their cells
+    in a policy_row, and for each schema the groups of lazy fields they need.
+    Fields of the other groups are never extracted.
+    '''
+    __slots__ = ("columns", "indexes", "groups", "full")
+
+    def __init__(self, columns):
+        unknown = [name for name in columns if name not in COL_NAMES]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}.")
+        self.columns = list(columns)
+        self.indexes = [COL_NAMES.index(name) for name in columns]
+        self.full = self.columns == COL_NAMES
+        self.groups = {}
+        for schema in ('2.0', '3.0'):
+            groups = {column_group(i + 1, schema) for i in self.indexes}
+            groups.discard(None)
+            self.groups[schema] = groups
+
+    def row(self, policy):
+        '''
+        Extracts the planned groups of a lazy policy, and gets its row
+        with the planned columns only.
+        '''
+        groups = self.groups.get(policy.schema, ALL_GROUPS)
+        with METRICS.timer("load"):
+            if self.full:
+                policy.load_all()
+            else:
+                for group in groups:
+                    policy.load(group)
+        with METRICS.timer("policy_row"):
+            row = policy_row(policy, groups)
+            if self.full:
+                return row
+            return [row[i] for i in self.indexes]
+
+# tuple of column names: its RowPlan, planned once per process.
+row_plans = {}
+
+def get_row_plan(columns):
+    '''
+    Gets the RowPlan of a list of output columns.
+    '''
+    key = tuple(columns)
+    if key not in row_plans:
+        row_plans[key] = RowPlan(columns)
+    return row_plans[key]
+
+def policy_summary_row(policy):
+    '''
+    Builds the summary row for a policy, see SUMMARY_COL_NAMES.
+    Only cheap fields are read, so no lazy field is ever extracted.
+    '''
+    return [policy.pol_name, policy.fund_name, policy.pdf_link, policy.status, \
+            policy.mo_prem, policy.state, policy.adults, policy.dpndnts, policy.pol_type]
+
+def scrape_policy(product, xml_file_name, funds_dict, lazy=False):
+    '''
+    Scrapes a single product into a policy object of its schema.
+    Unless lazy is set, every field of the policy is extracted here,
+    otherwise the expensive ones are only extracted once they are read.
+    '''
+    pdf_link = ""
+    schema = product['schemaversion']
+    if schema == '3.0':
+        policy = schema_3(product, xml_file_name, funds_dict, schema, pdf_link)
+    elif schema == '2.0':
+        policy = schema_2(product, xml_file_name, funds_dict, schema, pdf_link)
+    else:
+        return None
+    if not lazy:
+        policy.load_all()
+    return policy
+
+# backend: function scraping a product of that backend into a policy.
+SCRAPERS = {
+    "soup": scrape_policy,
+    "xpath": xpath_extract.scrape_policy,
+}
+
+def extract_row(product, xml_file_name, funds_dict, columns=COL_NAMES, backend="soup"):
+    '''
+    Extracts the row of a single product with the given columns,
+    see RowPlan. Returns the link of the policy and its row.
+    '''
+    plan = get_row_plan(columns)
+    with METRICS.timer("extract"):
+        policy = SCRAPERS[backend](product, xml_file_name, funds_dict, lazy=True)
+    return policy.pdf_link, plan.row(policy)
+
+def scrape_products(products, xml_file_name, funds_dict, product_count, first=1, store=None, \
+                    columns=COL_NAMES, backend="soup", checkpoint=None, table=None):
+    '''
+    Scrapes every product given and returns the rows of the policies found,
+    as a PolicyTable keyed by pdf_link. The rows are added to table if one
+    is given, in batches of TABLE_BATCH_SIZE.
+    first is the position of the first product, counting from 1.
+    If a product store is given, products that have not changed since
+    the last scrape reuse their stored row instead of being extracted.
+    The rows only have the given columns, the fields of the others are
+    not extracted.
+    backend is the one that read the products, see SCRAPERS.
+    Products filtered out are given as None (see filter_products) and skipped.
+    If a checkpoint is given, the row of every product is saved to it.
+    '''
+    if table is None:
+        table = PolicyTable(columns)
+    batch = []
+    pol_type = get_pol_type(xml_file_name)
+    progress = Progress("Scraping product {done} of {total} from xml file.", product_count, first - 1)
+    try:
+        for position, product in enumerate(products, first - 1):
+            progress.update()
+            if product is None:
+                METRICS.count("filtered_out")
+                if checkpoint is not None:
+                    # Saved without a row, so the saved positions stay contiguous.
+                    checkpoint.add(position, "", None)
+                continue
+            link, row = scrape_product(product, xml_file_name, funds_dict, pol_type, store, \
+                                       columns, backend)
+            batch.append((link, row))
+            if len(batch) >= TABLE_BATCH_SIZE:
+                table.add_rows(batch)
+                batch = []
+            if checkpoint is not None:
+                checkpoint.add(position, link, row)
+        table.add_rows(batch)
+    finally:
+        # The rows scraped so far are kept, even if a product failed.
+        if checkpoint is not None:
+            checkpoint.flush()
+    progress.close()
+
+    return table
+
+def scrape_product(product, xml_file_name, funds_dict, pol_type, store, columns, backend):
+    '''
+    Scrapes a single product of scrape_products into its link and row.
+    '''
+    METRICS.count("products")
+    if backend == "soup":
+        # Walk the product once so every field is served from one index.
+        with METRICS.timer("index"):
+            product = ProductIndex(product)
+    if store is None:
+        return extract_row(product, xml_file_name, funds_dict, columns, backend)
+    with METRICS.timer("store"):
+        if backend == "soup":
+            pol_id = find_all_soup(product, "fundcode") + "/" + product['productcode'].strip()
+            markup = str(product)
+        else:
+            pol_id, markup = xpath_extract.product_key(product)
+        digest = store.digest(markup)
+        row = store.get(pol_type, pol_id, digest)
+    if row is None:
+        _, row = extract_row(product, xml_file_name, funds_dict, backend=backend)
+        store.put(pol_type, pol_id, digest, row)
+    return row[COL_PDF_LINK - 1], row
+
+def scrape_products_incremental(products, xml_file_name, funds_dict, product_count, bundle, first=1, \
+                                backend="soup", checkpoint=None, table=None):
+    '''
+    Scrapes the products given with the product store of the cache directory.
+    '''
+    store = open_product_store(bundle)
+    try:
+        table = scrape_products(products, xml_file_name, funds_dict, product_count, first, store, \
+                                backend=backend, checkpoint=checkpoint, table=table)
+    finally:
+        store.close()
+    print(f"Reused {store.reused} unchanged products, extracted {store.extracted}.")
+
+    return table
+
+def filter_products(products, product_filter, backend="soup"):
+    '''
+    Yields the products given, with None in place of the ones that do not
+    match the filter, so that the others keep their positions.
+    '''
+    if backend == "xpath":
+        keep = product_filter.matches_element
+    else:
+        keep = product_filter.matches_soup
+    for product in products:
+        yield product if keep(product) else None
+
+def read_products(bundle, file, stream, backend="soup", start=0, product_filter=None):
+    '''
+    Reads the products of a policy XML file of the bundle, streamed one
+    at a time or from a soup of the whole file.
+    Only the products from position start are returned. With a product
+    filter, the products that do not match it are None.
+    Returns the product count of the file and the products.
+    '''
+    if product_filter:
+        product_filter = product_filter.for_file(file)
+    if backend == "xpath":
+        product_count, products = xpath_extract.read_products(bundle, file, stream, start)
+        if product_filter:
+            products = filter_products(products, product_filter, backend)
+        return product_count, products
+    if stream:
+        with bundle.open(file) as xml_file:
+            product_count = get_product_count(xml_file)
+        # Products filtered out are skipped before they are souped.
+        keep = product_filter.matches_element if product_filter else None
+        products = METRICS.timed_iter("parse", iter_products(bundle.open(file), start, keep=keep))
+    else:
+        print("... Creating soup ...\n")
+        with METRICS.timer("parse"), bundle.open(file) as xml_file:
+            xml_soup = BeautifulSoup(xml_file, "lxml")
+            product_count = xml_soup.find_all("products")[0]['count']
+            products = xml_soup.find_all("product")[start:]
+        if product_filter:
+            products = filter_products(products, product_filter)
+
+    return product_count, products
+
+def resume_rows(checkpoint, columns, start=0, stop=None):
+    '''
+    Gets the rows saved in the checkpoints of a file from position start,
+    as a PolicyTable with the given columns, and the number of products saved.
+    Without checkpoints, the table is empty and no product is saved.
+    '''
+    table = PolicyTable(columns)
+    if checkpoint is None:
+        return table, 0
+    saved = checkpoint.rows(start, stop)
+    table.add_rows((link, row) for _, link, row in saved if row is not None)
+    if saved:
+        print(f"Resuming after product {start + len(saved)}, from the last checkpoint.")
+    return table, len(saved)
+
+def extract_file(file, funds_dict, args, checkpoint):
+    '''
+    Scrapes all the policies of a single policy XML file, from the
+    products saved in its checkpoints on, if it has any.
+    Returns the PolicyTable of the policies and the product count of the file.
+    '''
+    table, done = resume_rows(checkpoint, output_columns(args))
+    with open_bundle(args.input) as bundle:
+        product_count, products = read_products(bundle, file, args.stream, args.backend, done, args.filter)
+
+        print(f"-- Scraping {file} file --")
+        print(f"Product Count in file: {product_count}")
+        if args.incremental:
+            scrape_products_incremental(products, file, funds_dict, product_count, bundle, \
+                                        done + 1, args.backend, checkpoint, table)
+        else:
+            scrape_products(products, file, funds_dict, product_count, done + 1, \
+                            columns=output_columns(args), backend=args.backend, \
+                            checkpoint=checkpoint, table=table)
+
+    return table, product_count
+
+def open_results(file, output_format, columns=COL_NAMES):
+    '''
+    Opens a new output file for the rows of a policy XML file,
+    in the given format (see sinks.SINKS), with the given columns.
+    '''
+    dest = f"{sys.path[0]}/results/{file[:len(file)-4]}" + \
+        datetime.datetime.now().strftime("%d %B %Y at %H.%M")
+    sink = open_sink(output_format, dest, columns)
+    print(f"-- Inputting into {sink.destination} {output_format} file --")
+    return sink
+
+def write_results(file, table, product_count, output_format, columns=COL_NAMES):
+    '''
+    Writes the PolicyTable of a policy XML file to a new output file
+    in the given format (see sinks.SINKS), with the given columns.
+    Returns the destination of the output file.
+    '''
+    sink = open_results(file, output_format, columns)
+
+    progress = Progress("Filling policy {done} out of {total} in " + output_format + " file.", product_count)
+    with METRICS.timer("write"):
+        sink.write_table(table)
+        sink.close()
+    progress.update(len(table))
+    progress.close()
+    # The policies of the file are extracted, nothing left needs to share their strings.
+    INTERNER.clear()
+
+    return sink.destination
+
+def output_columns(args):
+    '''
+    Gets the column names of the output files.
+    '''
+    if args.columns:
+        return args.columns
+    if args.summary:
+        return SUMMARY_COL_NAMES
+    return COL_NAMES
+
+def start_checkpoint(bundle, file, args):
+    '''
+    Opens the checkpoints of a policy XML file, with --checkpoint or
+    --resume only, returns None otherwise. Without --resume the
+    checkpoints of an earlier run are removed, so the file starts over.
+    '''
+    if not (args.checkpoint or args.resume):
+        return None
+    context = checkpoint_context(bundle, file, output_columns(args), args.filter.spec())
+    checkpoint = open_checkpoint(file, context)
+    if args.resume:
+        checkpoint.discard_others()
+    else:
+        checkpoint.clear()
+    return checkpoint
+
+def scrape_file(file, funds_dict, args):
+    '''
+    Scrapes a single policy XML file and writes its output file.
+    Returns the destination of the output file.
+    '''
+    with open_bundle(args.input) as bundle:
+        checkpoint = start_checkpoint(bundle, file, args)
+    if checkpoint is None:
+        table, product_count = extract_file(file, funds_dict, args, None)
+        return write_results(file, table, product_count, args.format, output_columns(args))
+    try:
+        dest = checkpoint.finished()
+        if dest is not None:
+            print(f"-- {file} was finished in {dest} --")
+            return dest
+        table, product_count = extract_file(file, funds_dict, args, checkpoint)
+        dest = write_results(file, table, product_count, args.format, output_columns(args))
+        # The output file is complete, its checkpoints are not needed anymore.
+        checkpoint.finish(dest)
+    finally:
+        checkpoint.close()
+    return dest
+
+# Funds information for worker processes, set once per worker by init_worker.
+worker_funds_dict = {}
+
+def init_worker(funds_dict):
+    '''
+    Stores the funds information in a worker process.
+    '''
+    global worker_funds_dict
+    worker_funds_dict = funds_dict
+
+def scrape_file_worker(file, args):
+    '''
+    Scrapes a policy XML file inside a worker process.
+    Returns the destination of the output file and the worker's metrics.
+    '''
+    dest = scrape_file(file, worker_funds_dict, args)
+    return dest, METRICS.take()
+
+def shard_products(xml_batch, product_filter, backend="soup"):
+    '''
+    Yields the products of a shard from their XML, read by the backend,
+    with None in place of the ones that do not match the filter.
+    '''
+    for xml in xml_batch:
+        if product_filter and not product_filter.matches_element(element_from_xml(xml)):
+            yield None
+        elif backend == "xpath":
+            yield element_from_xml(xml)
+        else:
+            yield soup_from_xml(xml)
+
+def scrape_shard_worker(file, start, xml_batch, product_count, context, args):
+    '''
+    Scrapes a shard of a policy XML file inside a worker process: the
+    products from position start, given as their XML.
+    The products saved in the file's checkpoints (with context) are not
+    scraped again. A context of None scrapes without checkpoints.
+    The worker's string pool is emptied once the shard is scraped.
+    Returns the PolicyTable of the products and the worker's metrics.
+    '''
+    checkpoint = open_checkpoint(file, context) if context is not None else None
+    try:
+        table, done = resume_rows(checkpoint, output_columns(args), start, start + len(xml_batch))
+        products = shard_products(xml_batch[done:], args.filter.for_file(file), args.backend)
+        products = METRICS.timed_iter("parse", products)
+        if args.incremental:
+            with open_bundle(args.input) as bundle:
+                scrape_products_incremental(products, file, worker_funds_dict, product_count, \
+                                            bundle, start + done + 1, args.backend, \
+                                            checkpoint, table)
+        else:
+            scrape_products(products, file, worker_funds_dict, product_count, \
+                            start + done + 1, columns=output_columns(args), \
+                            backend=args.backend, checkpoint=checkpoint, table=table)
+    finally:
+        if checkpoint is not None:
+            checkpoint.close()
+        # The rows are built, nothing left needs to share their strings.
+        INTERNER.clear()
+    return table, METRICS.take()
+
+def submit_shards(pool, bundle, file, product_count, context, args):
+    '''
+    Reads a policy XML file of the bundle once and sends its products to
+    the pool in shards of args.shard_size, as their XML.
+    At most args.workers shards wait in the pool at a time, so the XML of
+    the whole file is not held at once.
+    Returns the futures of the shards, in document order.
+    '''
+    futures = []
+    with bundle.open(file) as xml_file:
+        batches = iter_product_batches(xml_file, args.shard_size)
+        for n_shard, xml_batch in enumerate(METRICS.timed_iter("parse", batches)):
+            waiting = [future for future in futures if not future.done()]
+            if len(waiting) >= args.workers:
+                wait(waiting, return_when=FIRST_COMPLETED)
+            futures.append(pool.submit(scrape_shard_worker, file, n_shard * args.shard_size, \
+                                       xml_batch, product_count, context, args))
+    return futures
+
+def needs_shards(bundle, file, shard_size):
+    '''
+    Checks whether a policy XML file of the bundle declares more products
+    than the shard size, and so is split into shards.
+    '''
+    try:
+        with bundle.open(file) as xml_file:
+            return int(get_product_count(xml_file)) > shard_size
+    except (TypeError, ValueError):
+        return False
+
+def scrape_files_parallel(files, funds_dict, args):
+    '''
+    Spreads the policy XML files across a pool of worker processes.
+    The funds information is sent to each worker once. Small files are
+    scraped and written by a single worker. Files with more products
+    than the shard size are read once here and split into shards of
+    products that are scraped in parallel, then merged back in document
+    order and written here, so the output file is the same as the one
+    from a serial run.
+    '''
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, \
+                             initargs=(funds_dict,)) as pool, open_bundle(args.input) as bundle:
+        futures = []
+        sharded = []
+        for file in files:
+            if needs_shards(bundle, file, args.shard_size):
+                sharded.append(file)
+            else:
+                futures.append(pool.submit(scrape_file_worker, file, args))
+
+        for file in sharded:
+            with bundle.open(file) as xml_file:
+                product_count = get_product_count(xml_file)
+            # The checkpoints are closed while shards are sent, as workers
+            # forked meanwhile must not inherit an open sqlite connection.
+            checkpoint = start_checkpoint(bundle, file, args)
+            dest = context = None
+            if checkpoint is not None:
+                dest, context = checkpoint.finished(), checkpoint.context
+                checkpoint.close()
+            if dest is not None:
+                print(f"-- {file} was finished in {dest} --")
+                continue
+            print(f"-- Scraping {file} file in shards of {args.shard_size} products --")
+            shard_futures = submit_shards(pool, bundle, file, product_count, context, args)
+            # Merging in shard order keeps the order of a serial run.
+            table = PolicyTable(output_columns(args))
+            for future in shard_futures:
+                shard_table, worker_metrics = future.result()
+                table.update(shard_table)
+                METRICS.merge(worker_metrics)
+            dest = write_results(file, table, product_count, args.format, output_columns(args))
+            if context is not None:
+                checkpoint = open_checkpoint(file, context)
+                checkpoint.finish(dest)
+                checkpoint.close()
+            print(f"-- Finished {dest} --")
+        for future in as_completed(futures):
+            dest, worker_metrics = future.result()
+            METRICS.merge(worker_metrics)
+            print(f"-- Finished {dest} --")
+
+def extract_batch_worker(file, xml_batch, args):
+    '''
+    Extraction stage of the pipeline, inside a worker process: scrapes
+    a batch of products of a policy XML file from their XML. A product
+    whose link was already scraped in the batch is skipped, as write_stage
+    skips the links of earlier batches: the pipeline keeps the first row
+    of a link. The worker's string pool is emptied once the batch is scraped.
+    Returns the PolicyTable of the products and the worker's metrics.
+    '''
+    pol_type = get_pol_type(file)
+    rows = {}
+    try:
+        for xml in xml_batch:
+            with METRICS.timer("parse"):
+                if args.backend == "xpath":
+                    product = element_from_xml(xml)
+                else:
+                    product = soup_from_xml(xml)
+            link, row = scrape_product(product, file, worker_funds_dict, pol_type, None, \
+                                       output_columns(args), args.backend)
+            if link in rows:
+                METRICS.count("duplicate_links")
+                continue
+            rows[link] = row
+    finally:
+        INTERNER.clear()
+    table = PolicyTable(output_columns(args))
+    table.add_rows(rows.items())
+    return table, METRICS.take()
+
+def write_stage(futures, sink, progress, failures):
+    '''
+    Writer stage of the pipeline, in a thread: writes the tables of the
+    batches in the order they were sent, until it gets None. A product
+    whose link was already written in an earlier batch is skipped, so the
+    first row of a link is kept, as within a batch (see extract_batch_worker).
+    Other modes keep the later row, in the place of the first one, but that
+    row would come after the first one was written. If a batch fails, the
+    error is put in failures and the batches after it are dropped.
+    '''
+    written = set()
+    while True:
+        future = futures.get()
+        if future is None:
+            return
+        if failures:
+            future.cancel()
+            continue
+        try:
+            table, worker_metrics = future.result()
+            METRICS.merge(worker_metrics)
+            with METRICS.timer("write"):
+                progress.update(len(table))
+                duplicates = written.intersection(table.index)
+                if duplicates:
+                    METRICS.count("duplicate_links", len(duplicates))
+                    table = table.without(duplicates)
+                written.update(table.index)
+                sink.write_table(table)
+        except BaseException as error:
+            failures.append(error)
+
+def scrape_file_pipelined(pool, bundle, file, args):
+    '''
+    Scrapes a policy XML file through the pipeline. This process parses the
+    products and sends them in batches to the pool, while a thread writes
+    the rows of the batches in order. At most args.workers * PIPELINE_DEPTH
+    batches are sent but not written yet, so parsing waits for the slower
+    stages and memory stays bounded.
+    Returns the destination of the output file.
+    '''
+    with bundle.open(file) as xml_file:
+        product_count = get_product_count(xml_file)
+    print(f"-- Scraping {file} file in a pipeline --")
+    sink = open_results(file, args.format, output_columns(args))
+    progress = Progress("Scraping product {done} of {total} from xml file.", product_count)
+    futures = queue.Queue(maxsize=args.workers * PIPELINE_DEPTH)
+    failures = []
+    writer = threading.Thread(target=write_stage, \
+                              args=(futures, sink, progress, failures))
+    writer.start()
+    try:
+        keep = args.filter.for_file(file).matches_element if args.filter else None
+        with bundle.open(file) as xml_file:
+            batches = iter_product_batches(xml_file, PIPELINE_BATCH_SIZE, keep)
+            for batch in METRICS.timed_iter("parse", batches):
+                if failures:
+                    break
+                futures.put(pool.submit(extract_batch_worker, file, batch, args))
+    finally:
+        futures.put(None)
+        writer.join()
+    if failures:
+        raise failures[0]
+    with METRICS.timer("write"):
+        sink.close()
+    progress.close()
+
+    return sink.destination
+
+def scrape_files_pipelined(files, funds_dict, args):
+    '''
+    Scrapes the policy XML files one after the other, each through the
+    pipeline, with a single pool of args.workers extraction processes.
+    '''
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, \
+                             initargs=(funds_dict,)) as pool, open_bundle(args.input) as bundle:
+        for file in files:
+            dest = scrape_file_pipelined(pool, bundle, file, args)
+            print(f"-- Finished {dest} --")
+
+def parse_args():
+    '''
+    Parses the command line options.
+    '''
+    parser = argparse.ArgumentParser(description=TITLE)
+    parser.add_argument("--input", metavar="PATH", \
+        help="directory, zip archive or single (gzip/xz/bz2 compressed) XML file to scrape " \
+             f"(default: {XML_FILES_DIR})")
+    parser.add_argument("--stream", action="store_true", \
+        help="read products one at a time instead of souping whole files")
+    parser.add_argument("--workers", type=int, default=1, metavar="N", \
+        help="number of processes used to scrape the XML files")
+    parser.add_argument("--pipeline", action="store_true", \
+        help="parse, extract (in --workers processes) and write the products at the same time")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, metavar="N", \
+        help="with --workers, split files with more products than this into shards")
+    parser.add_argument("--backend", choices=sorted(SCRAPERS), default="soup", \
+        help="read the fields from a soup of each product, or with precompiled XPath " \
+             "expressions on the XML (default: soup)")
+    parser.add_argument("--format", choices=sorted(SINKS), default="xlsx", \
+        help="output format of the results (default: xlsx)")
+    parser.add_argument("--no-cache", action="store_true", \
+        help="parse the funds XML file again instead of using the cached funds")
+    parser.add_argument("--incremental", action="store_true", \
+        help="reuse the stored rows of products that did not change since the last run")
+    parser.add_argument("--metrics", metavar="FILE", \
+        help="JSON file the run metrics are written to (default: in the results directory)")
+    parser.add_argument("--checkpoint", action="store_true", \
+        help="checkpoint the rows of each file while it is scraped, for --resume")
+    parser.add_argument("--resume", action="store_true", \
+        help="go on from the last checkpoint of the files an interrupted --checkpoint " \
+             "run did not finish, and keep checkpointing")
+    parser.add_argument("--summary", action="store_true", \
+        help="only write the summary columns, without extracting the cover details")
+    parser.add_argument("--columns", nargs="+", metavar="NAME", \
+        help="only extract and write these columns, named as in the excel header")
+    parser.add_argument("--fund", nargs="+", metavar="CODE", \
+        help="only scrape the products of these funds, by fund code")
+    parser.add_argument("--state", nargs="+", metavar="STATE", \
+        help="only scrape the products available in these states")
+    parser.add_argument("--status", nargs="+", metavar="STATUS", \
+        help="only scrape the products with this status, e.g. Open")
+    parser.add_argument("--schema", nargs="+", choices=["2.0", "3.0"], \
+        help="only scrape the products of these schema versions")
+    parser.add_argument("--policy-type", nargs="+", choices=["Hospital", "General", "Combined"], \
+        help="only scrape the products of these policy types: the ProductType of schema 2.0 " \
+             "products, the type of their policy XML file for the others")
+    args = parser.parse_args()
+    args.filter = ProductFilter(args.fund, args.state, args.status, args.schema, args.policy_type)
+    if args.summary and args.columns:
+        parser.error("--summary cannot be used with --columns")
+    if (args.summary or args.columns) and args.incremental:
+        parser.error("--summary and --columns cannot be used with --incremental")
+    if args.columns:
+        try:
+            get_row_plan(args.columns)
+        except ValueError as error:
+            parser.error(str(error))
+    if args.pipeline and (args.incremental or args.checkpoint or args.resume):
+        parser.error("--pipeline cannot be used with --incremental, --checkpoint or --resume")
+    return args
 
 def main():
+    args = parse_args()
     print(TITLE)
 
     # Gets all information about the funds. 
     print("... Scraping funds XML file...\n")
-    funds_dict = parse_funds_file()
+    with open_bundle(args.input) as bundle:
+        with METRICS.timer("funds"):
+            funds_dict = load_funds(not args.no_cache, bundle)
 
-    # Get names of all the files we need to scrape.
-    entries = os.listdir(f"{sys.path[0]}/privatehealth-04-apr-2019")
-    files = []
-    for e in entries:
-        if ".xml" in e and "Funds" not in e:
-            files.append(e)
+        # Get names of all the files we need to scrape.
+        files = [file for file in bundle.policy_files() if args.filter.matches_file(file)]
 
     print("... Scraping the policy XML files ...\n")
-    for file in files:
-        xml_file_name = f"{sys.path[0]}/privatehealth-04-apr-2019/{file}"
-        xml_file = open(xml_file_name)
-        print("... Creating soup ...\n")
-        xml_soup = BeautifulSoup(xml_file, "lxml")
+    if args.pipeline:
+        scrape_files_pipelined(files, funds_dict, args)
+    elif args.workers > 1:
+        scrape_files_parallel(files, funds_dict, args)
+    else:
+        for file in files:
+            scrape_file(file, funds_dict, args)
 
-        # Key: link, Value: policy object
-        print(f"-- Scraping {file} file --")
-        policies = {}
-        pdf_link = ""
-        product_count = xml_soup.find_all("products")[0]['count']
-        print(f"Product Count in file: {product_count}")
-        products = xml_soup.find_all("product")
-        n_product = 1
-        for product in products:
-            print(f"Scraping product {n_product} of {product_count} from xml file.", end='\r')
-            n_product += 1
-            schema = product['schemaversion']
-            if schema == '3.0':
-                policy = schema_3(product, xml_file_name, funds_dict, schema, pdf_link)
-            elif schema == '2.0':
-                policy = schema_2(product, xml_file_name, funds_dict, schema, pdf_link)
-            policies[policy.pdf_link] = policy
-        print('\n')
-        
-        excel_dest = f"{sys.path[0]}/results/{file[:len(file)-4]}" + \
-            datetime.datetime.now().strftime("%d %B %Y at %H.%M") + ".xlsx"
-        print(f"-- Inputting into {excel_dest} excel file --")
-        create_excel(excel_dest)
-
-        wb = load_workbook(excel_dest)
-        ws = wb.active
-        n_pol = 1
-        for p in policies:
-            print(f"Filling policy {n_pol} out of {product_count} in excel sheet.", end='\r')
-            write_policy(excel_dest, policies[p], n_pol + 1, ws)
-            n_pol += 1
-        print("\n")
-        wb.save(excel_dest)
+    saved = METRICS.counts.get("interned_bytes", 0) / (1 << 20)
+    print(f"-- Interning dropped {METRICS.counts.get('interned', 0)} duplicate policy strings, {saved:.1f} MB --")
+    metrics_file = args.metrics or f"{sys.path[0]}/results/metrics " + \
+        datetime.datetime.now().strftime("%d %B %Y at %H.%M") + ".json"
+    METRICS.write_json(metrics_file)
+    print(f"-- Metrics written to {metrics_file} --")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,567 @@
+'''
+# This file contains the XPath extraction backend (--backend xpath).
+# The default backend reads every field through BeautifulSoup's find_all on
+# the lower-cased tags of the "lxml" HTML parser. This one works on the lxml
+# elements of the real, case-sensitive XML instead: every lookup is an
+# XPath expression compiled once (see PATHS), and no soup is ever built.
+#
+# xpath_schema_2 and xpath_schema_3 give the same policies as schema_2 and
+# schema_3 in xml_parser.py, field for field. This includes the way the soup
+# version renders tag names (lower-cased, as in "excessperadmission is $500")
+# and matches markup. Running this file compares both backends on a bundle:
+#   python xpath_extract.py --input privatehealth-04-apr-2019
+#
+# The tag and attribute names are the ones of the release's schema (see
+# synthetic.py). The XPath expressions are compiled once per XML namespace
+# of the files, so namespaced and plain files both work.
+'''
+
+import sys, argparse
+from xml.sax.saxutils import escape
+from lxml import etree
+
+from bundle import open_bundle, get_pol_type
+from general import GeneralService
+from hosp import HospService
+from memo import HOSP_MEMO, GENERAL_MEMO
+from metrics import METRICS
+from parse_funds import load_funds
+from policy import LazyNewPolicy, LazyOldPolicy, NOT_LOADED
+from stream import local_name, get_attr, get_product_count, iter_product_elements
+from constants import *
+
+# name: XPath expression, with {p} where the namespace prefix goes.
+# text_* expressions give the text of the first match, or "" if there is none.
+PATHS = {
+    "text_name": "string((.//{p}Name)[1])",
+    "text_fundcode": "string((.//{p}FundCode)[1])",
+    "text_productstatus": "string((.//{p}ProductStatus)[1])",
+    "text_premiumnorebate": "string((.//{p}PremiumNoRebate)[1])",
+    "text_state": "string((.//{p}State)[1])",
+    "text_scale": "string((.//{p}Scale)[1])",
+    "text_category": "string((.//{p}Category)[1])",
+    "text_producttype": "string((.//{p}ProductType)[1])",
+    "text_medicarelevysurchargeexempt": "string((.//{p}MedicareLevySurchargeExempt)[1])",
+    "text_dateissued": "string((.//{p}DateIssued)[1])",
+    "text_otherservices": "string((.//{p}OtherServices)[1])",
+    "text_otherproductfeatures": "string((.//{p}OtherProductFeatures)[1])",
+    "text_copayments": "string((.//{p}CoPayments)[1])",
+    "text_annuallimit": "string((.//{p}AnnualLimit)[1])",
+    "excesses": "(.//{p}Excesses)[1]",
+    "hospitalcover": "(.//{p}HospitalCover)[1]",
+    "medicalservices": "(.//{p}MedicalServices)[1]",
+    "medicalservice": ".//{p}MedicalService",
+    "waitingperiods": "(.//{p}WaitingPeriods)[1]",
+    "waitingperiod": ".//{p}WaitingPeriod",
+    "generalhealthservice": ".//{p}GeneralHealthService",
+    "benefit": ".//{p}Benefit",
+    "benefitlimit": ".//{p}BenefitLimit",
+    "service": ".//{p}Service",
+    "productpreferredproviderservices": "(.//{p}ProductPreferredProviderServices)[1]",
+    "preferredproviderservices": "(.//{p}PreferredProviderServices)[1]",
+    "productambulance": "(.//{p}ProductAmbulance)[1]",
+    "generalhealthambulance": "(.//{p}GeneralHealthAmbulance)[1]",
+    "corporate": "(.//{p}Corporate)[1]",
+    "agebaseddiscount": "(.//{p}AgeBasedDiscount)[1]",
+    # All the tags of a name, for the memo keys.
+    "all_hospitalcover": ".//{p}HospitalCover",
+    "all_waitingperiods": ".//{p}WaitingPeriods",
+    "all_otherproductfeatures": ".//{p}OtherProductFeatures",
+    "all_copayments": ".//{p}CoPayments",
+    "all_generalhealthservices": ".//{p}GeneralHealthServices",
+    "all_benefitlimits": ".//{p}BenefitLimits",
+    "all_generalhealthambulance": ".//{p}GeneralHealthAmbulance",
+}
+
+# Paths of the tags read by get_hosp_details, and by get_general_services
+# (with get_amb_info_old for schema 2.0), containers first, as in xml_parser.
+HOSP_TAGS = ["all_hospitalcover", "medicalservice", "all_waitingperiods", \
+             "all_otherproductfeatures", "all_copayments"]
+GENERAL_TAGS = ["all_generalhealthservices", "generalhealthservice", "all_benefitlimits", "benefitlimit"]
+OLD_GENERAL_TAGS = GENERAL_TAGS + ["all_generalhealthambulance"]
+
+# Text of an element and all its descendants, as soup's get_text().
+text_of = etree.XPath("string()")
+
+# namespace: {name: compiled XPath}
+compiled_paths = {}
+
+def get_paths(elem):
+    '''
+    Gets the compiled PATHS for the namespace of an element.
+    '''
+    namespace = etree.QName(elem).namespace
+    if namespace not in compiled_paths:
+        if namespace is None:
+            prefix, namespaces = "", None
+        else:
+            prefix, namespaces = "p:", {"p": namespace}
+        compiled_paths[namespace] = {
+            name: etree.XPath(path.format(p=prefix), namespaces=namespaces)
+            for name, path in PATHS.items()
+        }
+    return compiled_paths[namespace]
+
+def first(paths, name, elem):
+    '''
+    Gets the first element matched by a path, or None.
+    '''
+    found = paths[name](elem)
+    if not found:
+        return None
+    return found[0]
+
+def find_text(paths, elem, name):
+    '''
+    Gets the stripped text of the first tag with the given lower-cased
+    name, or "" if there is none, as find_all_soup does.
+    '''
+    return paths["text_" + name](elem).strip()
+
+def local_name_of(key):
+    '''
+    Gets the lower-cased name of an attribute, without namespace.
+    '''
+    return key.rpartition('}')[2].lower()
+
+def soup_tag(elem):
+    '''
+    Gets an element's start tag the way the soup version reads it from
+    str(tag): the lower-cased name followed by its attributes.
+    '''
+    attrs = "".join(f' {local_name_of(key)}="{escape(value)}"' for key, value in elem.attrib.items())
+    return local_name(elem) + attrs
+
+def markup_contains(elem, part):
+    '''
+    Checks if part is in the markup of an element and its descendants,
+    as rendered by soup, i.e. `part in str(tag)`.
+    '''
+    for child in elem.iter(etree.Element):
+        if part in f"<{soup_tag(child)}>" or part in f"</{local_name(child)}>":
+            return True
+        if child.text and part in escape(child.text):
+            return True
+        if child is not elem and child.tail and part in escape(child.tail):
+            return True
+    return False
+
+def descendants(elem):
+    '''
+    Gets every element below elem in document order, as soup's findChildren().
+    '''
+    return list(elem.iterdescendants(etree.Element))
+
+def subtree_parts(paths, product, schema, tags):
+    '''
+    Gets the schema and the markup of every element matched by one of the
+    paths that is not inside another one, i.e. all the XML an extractor reads.
+    '''
+    parts = [schema]
+    taken = set()
+    for name in tags:
+        for elem in paths[name](product):
+            if any(parent in taken for parent in elem.iterancestors()):
+                continue
+            taken.add(elem)
+            parts.append(etree.tostring(elem, with_tail=False))
+    return parts
+
+def get_excess(paths, product):
+    '''
+    Get all the excess information required.
+    '''
+    excesses = descendants(paths["excesses"](product)[0])
+    excess_str = ""
+    for excess in excesses:
+        excess_name = soup_tag(excess)
+        if "waiver" in excess_name:
+            excess_str += f"{excess_name} for {text_of(excess)}"
+            continue
+        else:
+            excess_str += f"{excess_name} is ${text_of(excess).strip()}\n"
+    if not excess_str:
+        return "No excess."
+    return excess_str
+
+def get_wait(paths, wait_element):
+    '''
+    Get the waiting period
+    '''
+    wait_str = ""
+    wait_periods = paths["waitingperiod"](wait_element)
+    if not wait_periods:
+        return "No waiting period found."
+    for wait_period in wait_periods:
+        try:
+            title = str(wait_period.attrib['Title'])
+            unit  = str(wait_period.attrib['Unit'])
+            text  = text_of(wait_period).strip()
+        except:
+            wait_str = "Cannot find wait."
+        wait_str += f"{title} wait is {text} {unit}s\n"
+
+    return wait_str
+
+@METRICS.timed("get_hosp_details")
+def get_hosp_details(paths, product, schema):
+    '''
+    Get all the hospital details required.
+    '''
+    covered = []
+    not_covered = []
+    limited_cover = []
+
+    hosp_cover = first(paths, "hospitalcover", product)
+    if hosp_cover is None:
+        return HospService("-", "-", "-", "-", "-", "-")
+    # The soup version stops at the first tag whose markup holds <medicalservices.
+    medical_services = first(paths, "medicalservices", hosp_cover)
+    stops = set()
+    if medical_services is not None:
+        stops.add(medical_services)
+        stops.update(medical_services.iterancestors())
+    for child in descendants(hosp_cover):
+        if child in stops: break
+        covered.append(f"{soup_tag(child)}: {text_of(child).strip()}")
+
+    for service in paths["medicalservice"](product):
+        if service.attrib['Cover'] == "Covered":
+            covered.append(str(service.attrib['Title']))
+        elif service.attrib['Cover'] == "NotCovered":
+            not_covered.append(str(service.attrib['Title']))
+        elif service.attrib['Cover'] == "Restricted":
+            limited_cover.append(str(service.attrib['Title']))
+
+    wait_element = paths["waitingperiods"](product)[0]
+    wait_str = get_wait(paths, wait_element)
+    other    = find_text(paths, product, "otherproductfeatures")
+    co_pay   = find_text(paths, product, "copayments")
+    if not co_pay:
+        co_pay = "No copayment."
+
+    return HospService(covered, not_covered, limited_cover, wait_str, other, co_pay)
+
+def get_benefits(paths, service):
+    '''
+    Gets all the benefit elements for a service.
+    '''
+    benefit_elements = paths["benefit"](service)
+    if not benefit_elements:
+        return "No benefits found."
+    ben_str = ""
+    for benefit in benefit_elements:
+        item = benefit.attrib['Item'].strip()
+        fee  = text_of(benefit).strip()
+        typ  = benefit.attrib['Type'].strip()
+        ben_str += f"{item} {fee} {typ}\n"
+
+    return ben_str
+
+@METRICS.timed("get_general_services")
+def get_general_services(paths, product, schema):
+    '''
+    Gets all information about the general services.
+    '''
+    general_services = paths["generalhealthservice"](product)
+    if not general_services:
+        return "No general services found."
+
+    general_details = {}
+    for service in general_services:
+        name = service.attrib['Title'].strip()
+        cover = service.attrib['Covered'].strip()
+        if cover == "false":
+            general_details[name] = GeneralService(name, cover, "-", "-", "-")
+            continue
+        wait_element = paths["waitingperiod"](service)[0]
+        wait_str = f"{text_of(wait_element).strip()} {wait_element.attrib['Unit']}s"
+        benefit  = get_benefits(paths, service)
+        general_details[name] = GeneralService(name, cover, wait_str, "", benefit)
+        if schema == '2.0':
+            general_details['Ambulance'] = GeneralService("Ambulance", "-", "-", "-", "-")
+
+    get_benefit_limits(paths, product, general_details)
+
+    return general_details
+
+@METRICS.timed("get_benefit_limits")
+def get_benefit_limits(paths, product, general_details):
+    '''
+    Gets all the limits of general services.
+    '''
+    for limit in paths["benefitlimit"](product):
+        if limit.attrib['Title'] == "Ambulance": continue
+        fee = "No fee"
+        for child in descendants(limit):
+            if markup_contains(child, 'limitper'):
+                fee = text_of(child).strip()
+        # Services with the same limit.
+        for s in paths["service"](limit):
+            service = text_of(s).strip()
+            general_details[service].limits = fee
+            if s.attrib['SubLimitsApply'] == "true":
+                general_details[service].limits += " sublimits apply"
+
+@METRICS.timed("get_prov_arr")
+def get_prov_arr(paths, product, fund_code, state, funds_dict, schema):
+    '''
+    Gets the provider arrangements for a policy.
+    '''
+    if schema == '3.0':
+        provider_element = first(paths, "productpreferredproviderservices", product)
+        if provider_element is None:
+            return "No provider arrangements found."
+        # False: product contains the provider.
+        if provider_element.attrib['UseFund'] == "false":
+            return text_of(provider_element).strip()
+        # True: provider can be found in the fund registry.
+        provider = funds_dict.provider(fund_code, state)
+        if provider is None:
+            return "No provider arrangements found."
+        return provider
+    elif schema == '2.0':
+        provider_element = first(paths, "preferredproviderservices", product)
+        if provider_element is None:
+            return "No provider arrangements found."
+        return text_of(provider_element).strip()
+
+    return "Wrong schema."
+
+def get_amb_info_new(paths, product, fund_code, state, funds_dict):
+    '''
+    Gets ambulance information for schema 3 policies, as
+    (amb_emer, amb_callout_fees, amb_other).
+    '''
+    product_ambulance = first(paths, "productambulance", product)
+    if product_ambulance is None:
+        return ("No ambulance information found.",) * 3
+    if product_ambulance.attrib['UseFund'] == "false":
+        return (text_of(product_ambulance).strip(),) * 3
+    return funds_dict.ambulance_details(fund_code, state)
+
+def get_amb_info_old(paths, product, general_dict):
+    '''
+    Gets ambulance information for schema 2 policies.
+    '''
+    if type(general_dict) is str:
+        return
+    ambulance = first(paths, "generalhealthambulance", product)
+    if ambulance is None:
+        general_dict['Ambulance'].limits = "Cant find ambulance info."
+        return
+    cover = ambulance.attrib['Cover']
+    if cover == "Full" or cover == "Part":
+        wait = paths["waitingperiod"](ambulance)[0]
+        wait_str = f"{text_of(wait).strip()} {wait.attrib['Unit']}"
+        # Get the limits.
+        benefit_limit = ""
+        for limit in paths["benefitlimit"](product):
+            if limit.attrib['Title'] == "Ambulance":
+                benefit_limit = find_text(paths, limit, "annuallimit")
+        general_dict['Ambulance'].limits = benefit_limit
+        general_dict['Ambulance'].wait   = wait_str
+
+def xpath_schema_3(product, xml_file, funds_dict, schema):
+    '''
+    Gets all the required information from new policies, i.e. schema 3.0
+    policies, as schema_3 does.
+    '''
+    paths = get_paths(product)
+    pol_name   = find_text(paths, product, "name")
+    fund_name  = find_text(paths, product, "fundcode")
+    prod_code  = product.attrib['ProductCode'].strip()
+    pol_id     = fund_name + "/" + prod_code
+    pdf_link   = DOWNLOAD_LINK + pol_id
+    status     = find_text(paths, product, "productstatus")
+    excess_str = get_excess(paths, product)
+    mo_prem    = find_text(paths, product, "premiumnorebate")
+    state      = find_text(paths, product, "state")
+    adults     = prod_code[len(prod_code)-2]
+    dpndnts    = find_text(paths, product, "scale")
+    pol_type   = get_pol_type(xml_file)
+    medicare   = find_text(paths, product, "medicarelevysurchargeexempt")
+    issue_date = find_text(paths, product, "dateissued")
+    other      = find_text(paths, product, "otherservices")
+    avail_for  = funds_dict.restrictions(fund_name)
+
+    def load_ambulance():
+        amb_emer, amb_callout_fees, amb_other = get_amb_info_new(paths, product, fund_name, state, funds_dict)
+        return {"amb_emer": amb_emer, "amb_callout_fees": amb_callout_fees, "amb_other": amb_other}
+
+    def load_hosp():
+        parts = subtree_parts(paths, product, schema, HOSP_TAGS)
+        return {"hosp_cover": HOSP_MEMO.get(parts, lambda: get_hosp_details(paths, product, schema))}
+
+    def load_general():
+        parts = subtree_parts(paths, product, schema, GENERAL_TAGS)
+        return {"gen_services": GENERAL_MEMO.get(parts, lambda: get_general_services(paths, product, schema))}
+
+    loaders = {
+        "hosp_cover": load_hosp,
+        "gen_services": load_general,
+        "prov_arr": lambda: {"prov_arr": get_prov_arr(paths, product, fund_name, state, funds_dict, schema)},
+        "ambulance": load_ambulance,
+    }
+    try:
+        corp = paths["corporate"](product)[0].attrib['Atomic']
+    except:
+        corp = "No corporate information found."
+    try:
+        age_disc = paths["agebaseddiscount"](product)[0].attrib['Available']
+    except:
+        age_disc = "Cannot find information on youth discount."
+    try:
+        accident_cov = paths["hospitalcover"](product)[0].attrib['AccidentCover']
+    except:
+        accident_cov = "No accident cover."
+    try:
+        trav_accom_ben = paths["hospitalcover"](product)[0].attrib['TravelOrAccommodationsBenefit']
+    except:
+        trav_accom_ben = "No travel and accommodation benefits."
+
+    return LazyNewPolicy(loaders, schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, \
+        state, adults, dpndnts, "None avail", pol_type, corp, medicare, issue_date, avail_for, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED, other, age_disc, trav_accom_ben, pol_id, accident_cov, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED)
+
+def xpath_schema_2(product, xml_file_name, funds_dict, schema):
+    '''
+    Gets all the information required for old policies, i.e. schema 2.0
+    policies, as schema_2 does.
+    '''
+    paths = get_paths(product)
+    pol_name   = find_text(paths, product, "name")
+    fund_name  = find_text(paths, product, "fundcode")
+    prod_code  = product.attrib['ProductCode'].strip()
+    pol_id     = fund_name + "/" + prod_code
+    pdf_link   = DOWNLOAD_LINK + pol_id
+    status     = find_text(paths, product, "productstatus")
+    excess_str = get_excess(paths, product)
+    mo_prem    = find_text(paths, product, "premiumnorebate")
+    state      = find_text(paths, product, "state")
+    adults     = prod_code[len(prod_code)-2]
+    dpndnts    = find_text(paths, product, "category")
+    pol_type   = find_text(paths, product, "producttype")
+    corp       = paths["corporate"](product)[0].attrib['Atomic']
+    medicare   = find_text(paths, product, "medicarelevysurchargeexempt")
+    issue_date = find_text(paths, product, "dateissued")
+    other      = find_text(paths, product, "otherservices")
+    avail_for  = funds_dict.restrictions(fund_name)
+
+    def load_hosp():
+        parts = subtree_parts(paths, product, schema, HOSP_TAGS)
+        return {"hosp_cover": HOSP_MEMO.get(parts, lambda: get_hosp_details(paths, product, schema))}
+
+    def build_general():
+        general = get_general_services(paths, product, schema)
+        get_amb_info_old(paths, product, general)
+        return general
+
+    def load_general():
+        if pol_type == 'Hospital':
+            return {"gen_services": ""}
+        parts = subtree_parts(paths, product, schema, OLD_GENERAL_TAGS)
+        return {"gen_services": GENERAL_MEMO.get(parts, build_general)}
+
+    loaders = {
+        "hosp_cover": load_hosp,
+        "gen_services": load_general,
+        "prov_arr": lambda: {"prov_arr": get_prov_arr(paths, product, fund_name, state, funds_dict, schema)},
+    }
+
+    return LazyOldPolicy(loaders, schema, pol_name, fund_name, pdf_link, status, excess_str, mo_prem, \
+        state, adults, dpndnts, "No avail", pol_type, corp, medicare, issue_date, avail_for, \
+        NOT_LOADED, NOT_LOADED, NOT_LOADED, other)
+
+def scrape_policy(product, xml_file_name, funds_dict, lazy=False):
+    '''
+    Scrapes a single product element into a policy object of its schema,
+    as xml_parser.scrape_policy does for soup products.
+    Streamed elements are cleared once the next one is read, so lazy
+    policies of streamed products must be loaded before that.
+    '''
+    schema = product.attrib['SchemaVersion']
+    if schema == '3.0':
+        policy = xpath_schema_3(product, xml_file_name, funds_dict, schema)
+    elif schema == '2.0':
+        policy = xpath_schema_2(product, xml_file_name, funds_dict, schema)
+    else:
+        return None
+    if not lazy:
+        policy.load_all()
+    return policy
+
+def product_key(product):
+    '''
+    Gets the pol_id (fundcode/productcode) and the XML of a product element,
+    used by the incremental product store.
+    '''
+    pol_id = find_text(get_paths(product), product, "fundcode") + "/" + product.attrib['ProductCode'].strip()
+    return pol_id, etree.tostring(product, with_tail=False).decode()
+
+def read_products(bundle, file, stream, start=0):
+    '''
+    Reads the product elements of a policy XML file of the bundle, streamed
+    one at a time or from the parsed tree of the whole file.
+    Only the products from position start are returned.
+    Returns the product count of the file and the products.
+    '''
+    if stream:
+        with bundle.open(file) as xml_file:
+            product_count = get_product_count(xml_file)
+        products = METRICS.timed_iter("parse", iter_product_elements(bundle.open(file), start))
+        return product_count, products
+
+    with METRICS.timer("parse"), bundle.open(file) as xml_file:
+        tree = etree.parse(xml_file, etree.XMLParser(huge_tree=True))
+    product_count = "Unknown"
+    products = []
+    for elem in tree.iter(etree.Element):
+        name = local_name(elem)
+        if name == 'products' and product_count == "Unknown":
+            product_count = get_attr(elem, 'count')
+        elif name == 'product':
+            products.append(elem)
+    return product_count, products[start:]
+
+def compare_backends(bundle, funds_dict):
+    '''
+    Scrapes every policy of the bundle with both backends and prints the
+    fields that differ. Returns the number of policies that differ.
+    '''
+    from bs4 import BeautifulSoup
+    from product_index import ProductIndex
+    from xml_parser import policy_row
+    from xml_parser import scrape_policy as soup_scrape_policy
+
+    n_diff = 0
+    for file in bundle.policy_files():
+        with bundle.open(file) as xml_file:
+            soup_products = BeautifulSoup(xml_file, "lxml").find_all("product")
+        _, products = read_products(bundle, file, False)
+        for soup_product, product in zip(soup_products, products):
+            expected = policy_row(soup_scrape_policy(ProductIndex(soup_product), file, funds_dict))
+            found = policy_row(scrape_policy(product, file, funds_dict))
+            diff = [name for name, a, b in zip(COL_NAMES, expected, found) if a != b]
+            if diff:
+                n_diff += 1
+                print(f"{file}: {expected[COL_PDF_LINK - 1]} differs in {', '.join(diff)}")
+        if len(soup_products) != len(products):
+            n_diff += 1
+            print(f"{file}: {len(soup_products)} soup products but {len(products)} XML products")
+    return n_diff
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the soup and XPath backends on a bundle.")
+    parser.add_argument("--input", metavar="PATH", \
+        help=f"directory, zip archive or single XML file to compare (default: {XML_FILES_DIR})")
+    args = parser.parse_args()
+    with open_bundle(args.input) as bundle:
+        n_diff = compare_backends(bundle, load_funds(bundle=bundle))
+    print(f"{n_diff} policies differ.")
+    sys.exit(1 if n_diff else 0)
+
+
+if __name__ == "__main__":
+    main()